@@ -0,0 +1,380 @@
+"""
+Clearing benchmark suite.
+
+Times the clearing engines on synthetic order books from 10^2 to 10^6 bids, the
+encode/decode of `ExchangeAgent.market_clearing` and a full `EL_Clearing_Env` hour,
+and stores the results as a JSON baseline. A later run can be compared against a
+baseline to catch regressions in clearing throughput:
+
+    python benchmark_clearing.py --output baseline.json
+    python benchmark_clearing.py --compare baseline.json --tolerance 0.25
+
+With --allocations it also counts the allocations of the bid stage per hour, with the
+bid payloads built every hour and reused:
+
+    python benchmark_clearing.py --sizes 1000 --allocations
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from bid_book import BUY, SELL, BidBook
+from market_clearing import Market
+
+# Bids of the Pinson lecture example used in `EL_Clearing_Env`, as (MWh, price)
+PINSON_SUPPLY = [
+    (120, 0), (50, 0), (200, 15), (400, 30), (60, 32.5), (50, 34), (60, 36), (100, 37.5),
+    (70, 39), (50, 40), (70, 60), (45, 70), (50, 100), (60, 150), (50, 200),
+]
+PINSON_DEMAND = [
+    (250, 200), (300, 110), (120, 100), (80, 90), (40, 85), (70, 75), (60, 65), (45, 40),
+    (30, 38), (35, 31), (25, 24), (10, 16),
+]
+
+PRICE_DISTRIBUTIONS = ("uniform", "normal", "pinson")
+DEFAULT_SIZES = (100, 1_000, 10_000, 100_000, 1_000_000)
+
+
+def synthetic_book(n_bids: int, price_distribution: str = "pinson", seed: int = 0):
+    """
+    Random supply and demand bids in the (id, MWh, price) format of `Market.market_clearing`.
+
+    Parameters:
+    - n_bids: Total number of bids, split evenly between supply and demand.
+    - price_distribution: "uniform" (0-200), "normal" (around 50) or "pinson" (the lecture
+      bids resampled with noise on quantities and prices).
+    - seed: Seed of the random generator.
+
+    Returns:
+    - supply_bids: List of tuples (id, MWh, price).
+    - demand_bids: List of tuples (id, MWh, price).
+    """
+    rng = np.random.default_rng(seed)
+    n_supply = n_bids // 2
+    n_demand = n_bids - n_supply
+
+    if price_distribution == "uniform":
+        supply_mwh, supply_price = rng.uniform(10, 400, n_supply), rng.uniform(0, 200, n_supply)
+        demand_mwh, demand_price = rng.uniform(10, 300, n_demand), rng.uniform(0, 200, n_demand)
+    elif price_distribution == "normal":
+        supply_mwh, supply_price = rng.uniform(10, 400, n_supply), rng.normal(50, 20, n_supply)
+        demand_mwh, demand_price = rng.uniform(10, 300, n_demand), rng.normal(55, 25, n_demand)
+    elif price_distribution == "pinson":
+        supply = np.array(PINSON_SUPPLY, dtype=np.float64)[rng.integers(0, len(PINSON_SUPPLY), n_supply)]
+        demand = np.array(PINSON_DEMAND, dtype=np.float64)[rng.integers(0, len(PINSON_DEMAND), n_demand)]
+        supply_mwh = supply[:, 0] * rng.uniform(0.8, 1.2, n_supply)
+        supply_price = supply[:, 1] + rng.normal(0, 1, n_supply)
+        demand_mwh = demand[:, 0] * rng.uniform(0.8, 1.2, n_demand)
+        demand_price = demand[:, 1] + rng.normal(0, 1, n_demand)
+    else:
+        raise ValueError(f"Unknown price distribution: {price_distribution}")
+
+    # Quantities and prices are rounded as bids would be submitted
+    supply_bids = list(zip(
+        (f"G{i+1}" for i in range(n_supply)), np.round(supply_mwh, 1).tolist(), np.round(supply_price, 2).tolist()
+    ))
+    demand_bids = list(zip(
+        (f"D{i+1}" for i in range(n_demand)), np.round(demand_mwh, 1).tolist(), np.round(demand_price, 2).tolist()
+    ))
+    return supply_bids, demand_bids
+
+
+def time_best(run, setup=None, repeats: int = 5):
+    """
+    Best wall time of `run` over `repeats` runs. `setup` is called before every run,
+    outside the timing, and its result is passed to `run`.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        run(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def repeats_for(n_bids: int) -> int:
+    return int(np.clip(1_000_000 // max(n_bids, 1), 1, 20))
+
+
+def benchmark_market(supply_bids, demand_bids, max_reference_bids: int):
+    """
+    Time the clearing engines of `Market` on one book.
+    """
+    n_bids = len(supply_bids) + len(demand_bids)
+    repeats = repeats_for(n_bids)
+    results = {}
+
+    if n_bids <= max_reference_bids:
+        # The reference loop sorts its inputs in place
+        def reference(supply, demand):
+            Market.market_clearing(supply, demand)
+
+        results["market_clearing"] = time_best(
+            reference, setup=lambda: (list(supply_bids), list(demand_bids)), repeats=repeats
+        )
+        results["market_clearing_pure"] = time_best(
+            lambda: Market.market_clearing_pure(supply_bids, demand_bids), repeats=repeats
+        )
+
+    supply_ids, supply_mwh, supply_price = (np.array(column) for column in zip(*supply_bids))
+    demand_ids, demand_mwh, demand_price = (np.array(column) for column in zip(*demand_bids))
+    results["market_clearing_vectorized"] = time_best(
+        lambda: Market.market_clearing_vectorized(
+            supply_ids, supply_mwh, supply_price, demand_ids, demand_mwh, demand_price
+        ),
+        repeats=repeats,
+    )
+
+    book = BidBook(n_bids)
+    book.extend(np.arange(supply_mwh.size), supply_mwh, supply_price, SELL)
+    book.extend(np.arange(demand_mwh.size), demand_mwh, demand_price, BUY)
+    out = BidBook(n_bids)
+    results["market_clearing_book"] = time_best(lambda: Market.market_clearing_book(book, out=out), repeats=repeats)
+    results["market_allocation_book"] = time_best(lambda: Market.market_allocation_book(book), repeats=repeats)
+
+    return results
+
+
+def benchmark_exchange_agent(supply_bids, demand_bids, backends=("reference", "numpy")):
+    """
+    Time `ExchangeAgent.market_clearing`, i.e. encoding the bid messages, clearing and
+    decoding the cleared bids into messages.
+    """
+    import phantom as ph
+    from elmarket_agents import BuyBid, ExchangeAgent, SellBid
+
+    sell_bids = [ph.Message(agent_id, "ExchangeAgent", SellBid(agent_id, mwh, price)) for agent_id, mwh, price in supply_bids]
+    buy_bids = [ph.Message(agent_id, "ExchangeAgent", BuyBid(agent_id, mwh, price)) for agent_id, mwh, price in demand_bids]
+    repeats = repeats_for(len(sell_bids) + len(buy_bids))
+
+    results = {}
+    for backend in backends:
+        agent = ExchangeAgent("ExchangeAgent", backend=backend)
+        results[f"exchange_agent_{backend}"] = time_best(
+            lambda: agent.market_clearing(buy_bids=buy_bids, sell_bids=sell_bids), repeats=repeats
+        )
+    return results
+
+
+def benchmark_env_hour(repeats: int = 20, **env_kwargs):
+    """
+    Time one hour of `EL_Clearing_Env` (the bid stage and the clearing stage).
+    """
+    from elmarket_agents import DummyAgent
+    from elmarket_env import EL_Clearing_Env
+
+    env = EL_Clearing_Env(**env_kwargs)
+
+    def hour():
+        for _ in range(2):
+            actions = {aid: 0.9 for aid in observations if isinstance(env.agents[aid], DummyAgent)}
+            env.step(actions)
+
+    best = float("inf")
+    with contextlib.redirect_stdout(io.StringIO()):
+        observations, _ = env.reset()
+        for _ in range(repeats):
+            if env.current_step + 2 > env.num_steps:
+                observations, _ = env.reset()
+            start = time.perf_counter()
+            hour()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_payload_allocations(supply_bids, demand_bids, reuse_payloads: bool, hours: int = 24):
+    """
+    Allocations of the bid stage of `EL_Clearing_Env`: every `GeneratorAgent` and
+    `SimpleDemandAgent` generates its bid messages for `hours` hours.
+
+    Returns:
+    - payloads_per_hour: Bid payloads built per hour, payloads sent again are not counted.
+    - bytes_per_hour: Memory allocated per hour for the messages, from tracemalloc.
+    - collections_per_hour: Garbage collections triggered per hour.
+    """
+    from elmarket_agents import GeneratorAgent, SimpleDemandAgent
+
+    agents = [
+        GeneratorAgent(agent_id, "ExchangeAgent", mwh, price, reuse_payloads=reuse_payloads)
+        for agent_id, mwh, price in supply_bids
+    ] + [
+        SimpleDemandAgent(agent_id, "ExchangeAgent", mwh, price, reuse_payloads=reuse_payloads)
+        for agent_id, mwh, price in demand_bids
+    ]
+
+    payloads = allocated = 0
+    previous_ids = set()
+    gc.collect()
+    collections = sum(stats["collections"] for stats in gc.get_stats())
+    tracemalloc.start()
+    try:
+        for _ in range(hours):
+            # The messages of the previous hour stay alive, so new payloads cannot reuse their ids
+            before = tracemalloc.get_traced_memory()[0]
+            messages = [agent.generate_messages(None) for agent in agents]
+            allocated += tracemalloc.get_traced_memory()[0] - before
+
+            ids = {id(payload) for batch in messages for _, payload in batch}
+            payloads += len(ids - previous_ids)
+            previous_ids = ids
+    finally:
+        tracemalloc.stop()
+    collections = sum(stats["collections"] for stats in gc.get_stats()) - collections
+
+    return {
+        "payloads_per_hour": payloads / hours,
+        "bytes_per_hour": allocated / hours,
+        "collections_per_hour": collections / hours,
+    }
+
+
+def run_allocations(sizes, price_distribution: str, seed: int):
+    """
+    Run the allocation benchmark with and without payload reuse.
+    """
+    records = []
+    for n_bids in sizes:
+        supply_bids, demand_bids = synthetic_book(n_bids, price_distribution, seed)
+        for reuse_payloads in (False, True):
+            result = benchmark_payload_allocations(supply_bids, demand_bids, reuse_payloads)
+            records.append({"n_bids": n_bids, "reuse_payloads": reuse_payloads, **result})
+            print(
+                f"{'reused' if reuse_payloads else 'rebuilt'} payloads {n_bids:>9} bids "
+                f"{result['payloads_per_hour']:>10.0f} payloads/h {result['bytes_per_hour'] / 1e3:>10.1f} kB/h "
+                f"{result['collections_per_hour']:>6.2f} GC/h",
+                flush=True,
+            )
+    return records
+
+
+def run_suite(sizes, price_distribution: str, seed: int, max_reference_bids: int, max_agent_bids: int):
+    """
+    Run all benchmarks and return the records of the JSON baseline.
+    """
+    records = []
+
+    def record(benchmark, n_bids, seconds):
+        records.append({
+            "benchmark": benchmark,
+            "n_bids": n_bids,
+            "seconds": seconds,
+            "bids_per_second": n_bids / seconds if seconds > 0 else None,
+        })
+        print(f"{benchmark:<32} {n_bids:>9} bids {seconds * 1e3:>12.3f} ms", flush=True)
+
+    for n_bids in sizes:
+        supply_bids, demand_bids = synthetic_book(n_bids, price_distribution, seed)
+        for benchmark, seconds in benchmark_market(supply_bids, demand_bids, max_reference_bids).items():
+            record(benchmark, n_bids, seconds)
+
+        if n_bids <= max_agent_bids:
+            try:
+                agent_results = benchmark_exchange_agent(supply_bids, demand_bids)
+            except ImportError as error:
+                print(f"Skipping the ExchangeAgent benchmark: {error}")
+                max_agent_bids = -1
+            else:
+                for benchmark, seconds in agent_results.items():
+                    record(benchmark, n_bids, seconds)
+
+    try:
+        record("env_hour", len(PINSON_SUPPLY) + len(PINSON_DEMAND), benchmark_env_hour())
+    except ImportError as error:
+        print(f"Skipping the EL_Clearing_Env benchmark: {error}")
+
+    return records
+
+
+def compare(records, baseline, tolerance: float):
+    """
+    Benchmarks that got slower than the baseline by more than `tolerance` (relative).
+
+    Returns:
+    - regressions: List of (benchmark, n_bids, baseline seconds, seconds).
+    """
+    reference = {(r["benchmark"], r["n_bids"]): r["seconds"] for r in baseline["results"]}
+    regressions = []
+    for r in records:
+        before = reference.get((r["benchmark"], r["n_bids"]))
+        if before is not None and r["seconds"] > before * (1 + tolerance):
+            regressions.append((r["benchmark"], r["n_bids"], before, r["seconds"]))
+    return regressions
+
+
+def _metadata(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "price_distribution": args.price_distribution,
+        "seed": args.seed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="book sizes in bids")
+    parser.add_argument("--price-distribution", choices=PRICE_DISTRIBUTIONS, default="pinson")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-reference-bids", type=int, default=1_000_000,
+                        help="largest book cleared with the pure Python loops")
+    parser.add_argument("--max-agent-bids", type=int, default=100_000,
+                        help="largest book sent through ExchangeAgent messages")
+    parser.add_argument("--allocations", action="store_true",
+                        help="also count the bid stage allocations per hour with and without payload reuse")
+    parser.add_argument("--output", help="write the results as a JSON baseline to this file")
+    parser.add_argument("--compare", help="JSON baseline to compare the results against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative slowdown against the baseline reported as a regression")
+    args = parser.parse_args(argv)
+
+    records = run_suite(
+        args.sizes, args.price_distribution, args.seed, args.max_reference_bids, args.max_agent_bids
+    )
+
+    output = {"meta": _metadata(args), "results": records}
+    if args.allocations:
+        try:
+            output["allocations"] = run_allocations(args.sizes, args.price_distribution, args.seed)
+        except ImportError as error:
+            print(f"Skipping the allocation benchmark: {error}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(output, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(records, baseline, args.tolerance)
+        for benchmark, n_bids, before, after in regressions:
+            print(f"REGRESSION {benchmark} ({n_bids} bids): {before * 1e3:.3f} ms -> {after * 1e3:.3f} ms")
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
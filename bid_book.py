@@ -0,0 +1,234 @@
+from hashlib import blake2b
+
+import numpy as np
+
+
+# Bid sides as stored in `BidBook.side`
+SELL = 0
+BUY = 1
+
+
+class AgentIndex():
+    """
+    Interns agent ids to compact int32 indices. Created once per env so every
+    component of the clearing path agrees on the same index for an agent.
+    """
+
+    def __init__(self, agent_ids=()):
+        self._index = {}
+        self._ids = []
+        self._id_array = None
+
+        for agent_id in agent_ids:
+            self.intern(agent_id)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, index):
+        return self._ids[index]
+
+    def intern(self, agent_id) -> int:
+        """
+        Index of the agent id, registering it if it was not seen before.
+        """
+        index = self._index.get(agent_id)
+        if index is None:
+            index = len(self._ids)
+            self._index[agent_id] = index
+            self._ids.append(agent_id)
+            self._id_array = None
+        return index
+
+    def get(self, agent_id, default=None):
+        """
+        Index of the agent id without registering it, `default` if it was not seen before.
+        """
+        return self._index.get(agent_id, default)
+
+    def lookup(self, indices):
+        """
+        Agent ids for an array of indices.
+        """
+        if self._id_array is None:
+            self._id_array = np.asarray(self._ids, dtype=object)
+        return self._id_array[indices]
+
+
+class BidBook():
+    """
+    Struct-of-arrays container of bids. Replaces lists of (id, MWh, price) tuples
+    with preallocated NumPy columns that are reused between steps.
+
+    Attributes:
+    -----------
+    agent (np.int32):   interned agent index, see `AgentIndex`
+    mwh (dtype):        the amount of MWh, np.float64 or np.int64 lots
+    price (dtype):      price of bid, np.float64 or np.int64 ticks (see `TickGrid`)
+    side (np.int8):     `SELL` or `BUY`
+    size (int):         number of bids in the book, columns are valid up to this length
+    """
+
+    __slots__ = ("_agent", "_mwh", "_price", "_side", "size")
+
+    def __init__(self, capacity: int = 64, dtype=np.float64):
+        capacity = max(int(capacity), 1)
+        self._agent = np.empty(capacity, dtype=np.int32)
+        self._mwh = np.empty(capacity, dtype=dtype)
+        self._price = np.empty(capacity, dtype=dtype)
+        self._side = np.empty(capacity, dtype=np.int8)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self) -> int:
+        return self._agent.size
+
+    @property
+    def agent(self):
+        return self._agent[:self.size]
+
+    @property
+    def mwh(self):
+        return self._mwh[:self.size]
+
+    @property
+    def price(self):
+        return self._price[:self.size]
+
+    @property
+    def side(self):
+        return self._side[:self.size]
+
+    @property
+    def dtype(self):
+        return self._price.dtype
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory held by the bids in the book.
+        """
+        return self.size * (
+            self._agent.itemsize + self._mwh.itemsize + self._price.itemsize + self._side.itemsize
+        )
+
+    def fingerprint(self) -> bytes:
+        """
+        Fast 128-bit hash of the bids in the book, used as key for cached clearing results.
+        """
+        digest = blake2b(digest_size=16)
+        for column in (self.agent, self.mwh, self.price, self.side):
+            digest.update(column.tobytes())
+        return digest.digest()
+
+    def copy(self):
+        """
+        Copy of the book, trimmed to its size.
+        """
+        book = BidBook(self.size, dtype=self.dtype)
+        book.extend(self.agent, self.mwh, self.price, self.side)
+        return book
+
+    def clear(self):
+        """
+        Empty the book, keeping the allocated columns for reuse.
+        """
+        self.size = 0
+        return self
+
+    def reserve(self, capacity: int):
+        """
+        Grow the columns to hold at least `capacity` bids.
+        """
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity)
+        for name in ("_agent", "_mwh", "_price", "_side"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, agent: int, mwh: float, price: float, side: int):
+        """
+        Add a single bid.
+        """
+        if self.size == self.capacity:
+            self.reserve(self.size + 1)
+        n = self.size
+        self._agent[n] = agent
+        self._mwh[n] = mwh
+        self._price[n] = price
+        self._side[n] = side
+        self.size = n + 1
+
+    def extend(self, agent, mwh, price, side):
+        """
+        Add many bids given as arrays (`side` may be a scalar).
+        """
+        agent = np.asarray(agent)
+        start, end = self.size, self.size + agent.size
+        self.reserve(end)
+        self._agent[start:end] = agent
+        self._mwh[start:end] = mwh
+        self._price[start:end] = price
+        self._side[start:end] = side
+        self.size = end
+
+    def select(self, side: int):
+        """
+        Positions of the bids on one side of the book.
+        """
+        return np.flatnonzero(self.side == side)
+
+    def merit_order(self):
+        """
+        Copy of the book in merit order: SELL bids by ascending price followed by BUY
+        bids by descending price, ties keep their order in the book.
+        """
+        book = BidBook(self.size, dtype=self.dtype)
+        for side, sign in ((SELL, 1), (BUY, -1)):
+            rows = self.select(side)
+            rows = rows[np.argsort(sign * self.price[rows], kind="stable")]
+            book.extend(self.agent[rows], self.mwh[rows], self.price[rows], side)
+        return book
+
+    def merge(self, book, out=None):
+        """
+        Insert the bids of `book` into this book, which must be in merit order (see
+        `merit_order`). Only the inserted bids are sorted, so the cost of a merge
+        scales with the size of `book`. At equal prices the bids of this book come first.
+
+        Parameters:
+        - book: BidBook with the bids to insert, in any order.
+        - out: Optional BidBook that is cleared and reused for the result.
+
+        Returns:
+        - merged: BidBook in merit order.
+        """
+        merged = (out if out is not None else BidBook(self.size + book.size, dtype=self.dtype)).clear()
+        merged.reserve(self.size + book.size)
+
+        for side, sign in ((SELL, 1), (BUY, -1)):
+            rows = self.select(side)
+            new_rows = book.select(side)
+            new_rows = new_rows[np.argsort(sign * book.price[new_rows], kind="stable")]
+
+            # Position of every inserted bid in the merged side
+            inserted = np.searchsorted(sign * self.price[rows], sign * book.price[new_rows], side="right")
+            inserted += np.arange(new_rows.size)
+            is_new = np.zeros(rows.size + new_rows.size, dtype=bool)
+            is_new[inserted] = True
+
+            start = merged.size
+            merged.size = start + is_new.size
+            for name in ("_agent", "_mwh", "_price"):
+                column = getattr(merged, name)[start:merged.size]
+                column[is_new] = getattr(book, name)[new_rows]
+                column[~is_new] = getattr(self, name)[rows]
+            merged._side[start:merged.size] = side
+
+        return merged
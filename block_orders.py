@@ -0,0 +1,202 @@
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import Bounds, LinearConstraint, linprog, milp
+
+from bid_book import BUY, SELL
+from market_clearing import Market
+
+
+@dataclass(frozen=True)
+class BlockClearingResult:
+    """
+    Result of a multi-hour clearing with block orders.
+
+    Attributes:
+    -----------
+    clearing_prices (np.ndarray):   price per hour (merit-order price of its hourly bids)
+    supply_allocation (np.ndarray): cleared MWh per hourly supply bid (hours x supply bids)
+    demand_allocation (np.ndarray): cleared MWh per hourly demand bid (hours x demand bids)
+    block_accepted (np.ndarray):    True for every accepted block order
+    welfare (float):                total surplus of the accepted bids
+    solver_time (float):            seconds spent in the solver for this clear
+    warm_started (bool):            True if the previous block acceptance was proven optimal
+                                    and the MILP was skipped
+    """
+
+    clearing_prices: np.ndarray
+    supply_allocation: np.ndarray
+    demand_allocation: np.ndarray
+    block_accepted: np.ndarray
+    welfare: float
+    solver_time: float
+    warm_started: bool
+
+
+class BlockOrderClearing():
+    """
+    Welfare maximizing clearing of hourly bids together with block orders that are
+    accepted for all of their hours or not at all, solved as a MILP with HiGHS.
+
+    Hourly bids use the (hours x bids) layout of `Market.market_clearing_batch`. A block
+    order is a MWh profile over the hours at a single price, selling (`SELL`) or buying (`BUY`).
+
+    Hourly prices follow the convention of `Market.merit_order` over the hourly bids (see
+    `Market.marginal_prices`), as the duals of the hourly balance can be anywhere in a
+    degenerate price interval. Accepted blocks are fixed injections and do not set the
+    price; an hour that clears no hourly supply keeps the dual.
+
+    The solver keeps the block acceptance of the previous clear. If the blocks are the same,
+    that acceptance is checked against the LP relaxation first and the MILP is only solved
+    when it is no longer optimal.
+
+    Attributes:
+    -----------
+    tolerance (float):  relative welfare tolerance used to accept the warm start
+    n_clears (int):     number of clears
+    n_warm_starts (int): number of clears that reused the previous block acceptance
+    """
+
+    def __init__(self, tolerance: float = 1e-9):
+        self.tolerance = tolerance
+        self.n_clears: int = 0
+        self.n_warm_starts: int = 0
+
+        self._previous_blocks = None
+        self._previous_accepted = None
+
+    def reset(self):
+        self._previous_blocks = None
+        self._previous_accepted = None
+
+    def clear(self, supply_mwh, supply_price, demand_mwh, demand_price, block_mwh, block_price, block_side):
+        """
+        Clear all hours with block orders.
+
+        Parameters:
+        - supply_mwh, supply_price: Arrays (hours x supply bids) of hourly supply bids.
+        - demand_mwh, demand_price: Arrays (hours x demand bids) of hourly demand bids.
+        - block_mwh: Array (blocks x hours) with the MWh profile of every block order.
+        - block_price: Array (blocks,) with the price per MWh of every block order.
+        - block_side: Array (blocks,) with `SELL` or `BUY` for every block order.
+
+        Returns:
+        - result: BlockClearingResult
+        """
+        start = time.perf_counter()
+
+        supply_mwh = np.atleast_2d(np.asarray(supply_mwh, dtype=np.float64))
+        supply_price = np.atleast_2d(np.asarray(supply_price, dtype=np.float64))
+        demand_mwh = np.atleast_2d(np.asarray(demand_mwh, dtype=np.float64))
+        demand_price = np.atleast_2d(np.asarray(demand_price, dtype=np.float64))
+        n_hours = supply_mwh.shape[0]
+        block_mwh = np.asarray(block_mwh, dtype=np.float64).reshape(-1, n_hours)
+        block_price = np.asarray(block_price, dtype=np.float64).ravel()
+        block_side = np.asarray(block_side, dtype=np.int8).ravel()
+        if np.any((block_side != SELL) & (block_side != BUY)):
+            raise ValueError("Block order sides must be SELL or BUY")
+
+        cost, balance, upper = _block_problem(
+            supply_mwh, supply_price, demand_mwh, demand_price, block_mwh, block_price, block_side
+        )
+        n_blocks = block_price.size
+        n_hourly = cost.size - n_blocks
+        equal = LinearConstraint(balance, np.zeros(n_hours), np.zeros(n_hours))
+
+        # Warm start: keep the previous block acceptance if no relaxation can do better
+        blocks = (block_mwh.tobytes(), block_price.tobytes(), block_side.tobytes())
+        accepted = None
+        warm_started = False
+        if self._previous_blocks == blocks:
+            fixed = _solve_fixed(cost, balance, upper, n_hourly, self._previous_accepted)
+            relaxed = linprog(
+                cost, A_eq=balance, b_eq=np.zeros(n_hours),
+                bounds=np.column_stack((np.zeros(cost.size), upper)), method="highs",
+            )
+            bound = relaxed.fun + self.tolerance * max(1.0, abs(relaxed.fun)) if relaxed.status == 0 else None
+            if fixed.status == 0 and bound is not None and fixed.fun <= bound:
+                accepted = self._previous_accepted
+                warm_started = True
+
+        if accepted is None:
+            integrality = np.concatenate((np.zeros(n_hourly), np.ones(n_blocks)))
+            solution = milp(cost, constraints=equal, integrality=integrality, bounds=Bounds(np.zeros(cost.size), upper))
+            if solution.status != 0:
+                raise RuntimeError(f"Block order clearing failed: {solution.message}")
+            accepted = np.round(solution.x[n_hourly:]).astype(bool)
+            fixed = _solve_fixed(cost, balance, upper, n_hourly, accepted)
+
+        # Prices are the merit-order prices of the hourly bids with the block acceptance fixed
+        if fixed.status != 0:
+            raise RuntimeError(f"Block order pricing failed: {fixed.message}")
+        n_supply = supply_mwh.size
+        supply_allocation = fixed.x[:n_supply].reshape(supply_mwh.shape)
+        demand_allocation = fixed.x[n_supply:n_hourly].reshape(demand_mwh.shape)
+        clearing_prices = Market.marginal_prices(
+            n_hours,
+            np.repeat(np.arange(n_hours), supply_mwh.shape[1]), supply_mwh.ravel(), supply_price.ravel(),
+            supply_allocation.ravel(),
+            np.repeat(np.arange(n_hours), demand_mwh.shape[1]), demand_mwh.ravel(), demand_price.ravel(),
+            demand_allocation.ravel(),
+        )
+        clearing_prices = np.where(np.isnan(clearing_prices), fixed.eqlin.marginals, clearing_prices)
+
+        self._previous_blocks = blocks
+        self._previous_accepted = accepted
+        self.n_clears += 1
+        self.n_warm_starts += warm_started
+
+        return BlockClearingResult(
+            clearing_prices=clearing_prices,
+            supply_allocation=supply_allocation,
+            demand_allocation=demand_allocation,
+            block_accepted=accepted,
+            welfare=-float(fixed.fun),
+            solver_time=time.perf_counter() - start,
+            warm_started=warm_started,
+        )
+
+
+def _block_problem(supply_mwh, supply_price, demand_mwh, demand_price, block_mwh, block_price, block_side):
+    """
+    Cost vector, sparse hourly balance matrix and upper bounds of the welfare problem.
+    Variables are the hourly supply MWh, the hourly demand MWh and one acceptance per block.
+    """
+    n_hours = supply_mwh.shape[0]
+    sign = np.where(block_side == SELL, 1.0, -1.0)
+
+    cost = np.concatenate((
+        supply_price.ravel(),
+        -demand_price.ravel(),
+        sign * block_price * block_mwh.sum(axis=1),
+    ))
+    upper = np.concatenate((supply_mwh.ravel(), demand_mwh.ravel(), np.ones(block_price.size)))
+
+    # Supply minus demand in every hour, hourly bids only touch their own row
+    supply_hour = np.repeat(np.arange(n_hours), supply_mwh.shape[1])
+    demand_hour = np.repeat(np.arange(n_hours), demand_mwh.shape[1])
+    balance = sparse.hstack((
+        sparse.csr_array(
+            (np.ones(supply_mwh.size), (supply_hour, np.arange(supply_mwh.size))), shape=(n_hours, supply_mwh.size)
+        ),
+        sparse.csr_array(
+            (-np.ones(demand_mwh.size), (demand_hour, np.arange(demand_mwh.size))), shape=(n_hours, demand_mwh.size)
+        ),
+        sparse.csr_array(sign[None, :] * block_mwh.T),
+    ), format="csr")
+
+    return cost, balance, upper
+
+
+def _solve_fixed(cost, balance, upper, n_hourly, accepted):
+    """
+    LP over the hourly bids with the block acceptance fixed.
+    """
+    accepted = np.asarray(accepted, dtype=np.float64)
+    bounds = np.column_stack((
+        np.concatenate((np.zeros(n_hourly), accepted)),
+        np.concatenate((upper[:n_hourly], accepted)),
+    ))
+    return linprog(cost, A_eq=balance, b_eq=np.zeros(balance.shape[0]), bounds=bounds, method="highs")
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+
+class ClearingCache():
+    """
+    LRU cache of clearing results keyed by the fingerprint of the bid book.
+    Hours with the same bids as a previous clearing cost a hash lookup instead of a clear.
+
+    Attributes:
+    -----------
+    maxsize (int):  maximum number of cached results, least recently used ones are evicted
+    hits (int):     number of lookups that found a cached result
+    misses (int):   number of lookups that did not
+    """
+
+    def __init__(self, maxsize: int = 128):
+        if maxsize < 1:
+            raise ValueError(f"Cache size must be positive: {maxsize}")
+        self.maxsize = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Cached result for the key, None if there is none.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        """
+        Store a result, evicting the least recently used one when full.
+        """
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop all cached results and reset the counters.
+        """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
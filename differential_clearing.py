@@ -0,0 +1,469 @@
+"""
+Differential harness for the clearing backends.
+
+Generates random and adversarial order books, clears every book with the reference
+loop `Market.market_clearing` and with each fast backend side by side, and compares
+the clearing price, the cleared volume and the allocation of every bid within a
+tolerance. Timing ratios against the reference loop are reported per backend.
+
+Backend variants named "backend:option+option" enable a pricing rule (compared with
+the reference under the same rule, including the payment of every bid), fixed-point
+`ticks` (compared with the reference on the book rounded to the grid), or a tie
+breaking rule (compared per price level, as bids at one level may share the volume
+differently, and with the same book shuffled, which must not change any allocation). `market_clearing_curves` clears every bid as a one-step curve.
+
+`pivotal_supplier_analysis` is checked against clearing the book again without each
+supply bid. The fixed `REGRESSION_BOOKS` run before the generated ones.
+
+    python differential_clearing.py --books 500 --seed 0
+
+Exits non-zero on any mismatch.
+"""
+import argparse
+import sys
+import time
+from collections import defaultdict
+from functools import partial
+from itertools import cycle, islice
+
+import numpy as np
+
+from bid_book import BUY, SELL, BidBook
+from market_analysis import pivotal_supplier_analysis
+from market_clearing import PRICING_RULES, TIE_BREAKING, Market, TickGrid
+from order_book import OrderBook
+from parallel_clearing import clear_zone
+
+BOOK_KINDS = ("random", "ties", "zero_quantity", "no_crossing", "total_overlap", "equal_totals", "one_sided", "decimal")
+
+VARIANT_OPTIONS = PRICING_RULES + TIE_BREAKING + ("ticks",)
+
+# Books that exposed bugs, as (supply_bids, demand_bids)
+REGRESSION_BOOKS = {
+    # A zero-quantity supply bid must never be the marginal bid once another bid is withheld
+    "zero_quantity_marginal": (
+        [("A", 10.0, 10.0), ("Z", 0.0, 50.0), ("B", 10.0, 30.0)],
+        [("D", 15.0, 100.0)],
+    ),
+}
+
+
+def adversarial_book(kind: str, rng: np.random.Generator, max_bids: int = 40):
+    """
+    Order book of the given kind as lists of (id, MWh, price) tuples.
+
+    Parameters:
+    - kind: One of `BOOK_KINDS`.
+    - rng: Random generator.
+    - max_bids: Maximum number of bids per side.
+
+    Returns:
+    - supply_bids: List of tuples (id, MWh, price).
+    - demand_bids: List of tuples (id, MWh, price).
+    """
+    n_supply, n_demand = rng.integers(1, max_bids + 1, 2)
+    supply_mwh = rng.integers(1, 100, n_supply).astype(np.float64)
+    demand_mwh = rng.integers(1, 100, n_demand).astype(np.float64)
+    supply_price = rng.integers(0, 200, n_supply).astype(np.float64)
+    demand_price = rng.integers(0, 200, n_demand).astype(np.float64)
+
+    if kind == "random":
+        pass
+    elif kind == "ties":
+        # Few price levels shared by both sides
+        levels = rng.integers(0, 200, 3).astype(np.float64)
+        supply_price, demand_price = rng.choice(levels, n_supply), rng.choice(levels, n_demand)
+    elif kind == "zero_quantity":
+        supply_mwh[rng.random(n_supply) < 0.3] = 0.0
+        demand_mwh[rng.random(n_demand) < 0.3] = 0.0
+    elif kind == "no_crossing":
+        supply_price = rng.integers(101, 200, n_supply).astype(np.float64)
+        demand_price = rng.integers(0, 100, n_demand).astype(np.float64)
+    elif kind == "total_overlap":
+        supply_price = rng.integers(0, 100, n_supply).astype(np.float64)
+        demand_price = rng.integers(100, 200, n_demand).astype(np.float64)
+    elif kind == "equal_totals":
+        # Both sides split the same total at the same breakpoints
+        cuts = np.unique(rng.integers(1, 1000, max(n_supply, n_demand)))
+        mwh = np.diff(np.concatenate(([0], cuts, [1000]))).astype(np.float64)
+        n_supply = n_demand = mwh.size
+        supply_mwh, demand_mwh = mwh, mwh[::-1].copy()
+        supply_price = np.sort(rng.integers(0, 100, n_supply)).astype(np.float64)
+        demand_price = np.sort(rng.integers(0, 100, n_demand))[::-1].astype(np.float64)
+    elif kind == "one_sided":
+        # A single bid facing many
+        n_supply = 1
+        supply_mwh, supply_price = supply_mwh[:1], supply_price[:1]
+    elif kind == "decimal":
+        # Prices and quantities that are not exact in binary floating point
+        supply_mwh, demand_mwh = supply_mwh / 10, demand_mwh / 10
+        supply_price, demand_price = supply_price / 10 + 0.1, demand_price / 10 + 0.2
+    else:
+        raise ValueError(f"Unknown book kind: {kind}")
+
+    supply_bids = list(zip((f"S{i}" for i in range(n_supply)), supply_mwh.tolist(), supply_price.tolist()))
+    demand_bids = list(zip((f"D{i}" for i in range(n_demand)), demand_mwh.tolist(), demand_price.tolist()))
+    return supply_bids, demand_bids
+
+
+def _allocations(cleared_bids):
+    """
+    Cleared MWh per bid id from (supply_id, demand_id, MWh, price) matches.
+    """
+    allocation = defaultdict(float)
+    for supply_id, demand_id, mwh, _ in cleared_bids:
+        allocation[supply_id] += mwh
+        allocation[demand_id] += mwh
+    return allocation
+
+
+def _payments(cleared_bids):
+    """
+    Settled amount (MWh times price) per bid id from (supply_id, demand_id, MWh, price) matches.
+    """
+    payment = defaultdict(float)
+    for supply_id, demand_id, mwh, price in cleared_bids:
+        payment[supply_id] += mwh * price
+        payment[demand_id] += mwh * price
+    return payment
+
+
+def _columns(bids):
+    ids, mwh, price = zip(*bids)
+    return np.array(ids, dtype=object), np.array(mwh, dtype=np.float64), np.array(price, dtype=np.float64)
+
+
+def _keys(ids):
+    """
+    Index of every bid id among the sorted ids, a tie breaking key that follows the bids when they are shuffled.
+    """
+    return np.unique(ids.astype(str), return_inverse=True)[1].ravel()
+
+
+# Every backend clears (supply_bids, demand_bids) and returns (clearing price, allocation
+# per bid id, payment per bid id or None if it only computes allocations)
+
+def _reference(supply_bids, demand_bids, pricing="uniform", tolerance: float = 0.0):
+    """
+    Reference loop without its zero and float dust matches.
+
+    The loop records 0 MWh matches with zero-quantity bids and float remainders far below
+    the tolerance (e.g. 7.0 - 5.7 - 1.3), which the other engines never produce. Both can
+    set its clearing price, which is then taken again from the last remaining match.
+    """
+    cleared_bids, clearing_price = Market.market_clearing(list(supply_bids), list(demand_bids), pricing)
+
+    kept = [cleared_bid for cleared_bid in cleared_bids if abs(cleared_bid[2]) > tolerance]
+    if len(kept) < len(cleared_bids):
+        supply_price = {bid_id: price for bid_id, _, price in supply_bids}
+        demand_price = {bid_id: price for bid_id, _, price in demand_bids}
+        clearing_price = min(supply_price[kept[-1][0]], demand_price[kept[-1][1]]) if kept else None
+        if pricing == "uniform":
+            kept = [(supply_id, demand_id, mwh, clearing_price) for supply_id, demand_id, mwh, _ in kept]
+
+    return clearing_price, _allocations(kept), _payments(kept)
+
+
+def _pure(supply_bids, demand_bids, pricing="uniform"):
+    result = Market.market_clearing_pure(supply_bids, demand_bids, pricing=pricing)
+    return result.clearing_price, _allocations(result.cleared_bids), _payments(result.cleared_bids)
+
+
+def _vectorized(supply_bids, demand_bids, pricing="uniform", ticks=None):
+    cleared_bids, clearing_price = Market.market_clearing_vectorized(
+        *_columns(supply_bids), *_columns(demand_bids), pricing=pricing, ticks=ticks
+    )
+    return clearing_price, _allocations(cleared_bids), _payments(cleared_bids)
+
+
+def _book(supply_bids, demand_bids, ticks=None, tie_breaking="time", seed=0):
+    supply_ids, supply_mwh, supply_price = _columns(supply_bids)
+    demand_ids, demand_mwh, demand_price = _columns(demand_bids)
+    if ticks is not None:
+        supply_mwh, supply_price = ticks.to_lots(supply_mwh), ticks.to_ticks(supply_price)
+        demand_mwh, demand_price = ticks.to_lots(demand_mwh), ticks.to_ticks(demand_price)
+
+    book = BidBook(supply_mwh.size + demand_mwh.size, dtype=np.int64 if ticks is not None else np.float64)
+    book.extend(_keys(supply_ids), supply_mwh, supply_price, SELL)
+    book.extend(_keys(demand_ids), demand_mwh, demand_price, BUY)
+
+    allocation, clearing_price = Market.market_allocation_book(book, tie_breaking=tie_breaking, seed=seed)
+    if ticks is not None:
+        allocation = ticks.from_lots(allocation)
+        if clearing_price is not None:
+            clearing_price = float(ticks.from_ticks(clearing_price))
+    ids = np.concatenate((supply_ids, demand_ids))
+    return clearing_price, dict(zip(ids, allocation.tolist())), None
+
+
+def _order_book(supply_bids, demand_bids, pricing="uniform"):
+    order_book = OrderBook()
+    order_book.sync(supply_bids=supply_bids, demand_bids=demand_bids)
+    cleared_bids, clearing_price = order_book.market_clearing(pricing=pricing)
+    return clearing_price, _allocations(cleared_bids), _payments(cleared_bids)
+
+
+def _zone(supply_bids, demand_bids, ticks=None, tie_breaking="time", seed=0):
+    supply_ids, supply_mwh, supply_price = _columns(supply_bids)
+    demand_ids, demand_mwh, demand_price = _columns(demand_bids)
+    mwh = np.concatenate((supply_mwh, demand_mwh))
+    price = np.concatenate((supply_price, demand_price))
+    if ticks is not None:
+        mwh, price = ticks.to_lots(mwh), ticks.to_ticks(price)
+    side = np.concatenate((np.full(supply_mwh.size, SELL, dtype=np.int8), np.full(demand_mwh.size, BUY, dtype=np.int8)))
+    clearing_price, allocation = clear_zone(
+        mwh, price, side, tie_breaking, seed=seed, key=np.concatenate((_keys(supply_ids), _keys(demand_ids))),
+    )
+    if ticks is not None:
+        allocation = ticks.from_lots(allocation)
+        clearing_price = ticks.from_ticks(clearing_price)
+    ids = np.concatenate((supply_ids, demand_ids))
+    return (None if np.isnan(clearing_price) else float(clearing_price)), dict(zip(ids, allocation.tolist())), None
+
+
+def _batch(supply_bids, demand_bids):
+    supply_ids, supply_mwh, supply_price = _columns(supply_bids)
+    demand_ids, demand_mwh, demand_price = _columns(demand_bids)
+    prices, supply_allocation, demand_allocation = Market.market_clearing_batch(
+        supply_mwh[None], supply_price[None], demand_mwh[None], demand_price[None]
+    )
+    ids = np.concatenate((supply_ids, demand_ids))
+    allocation = np.concatenate((supply_allocation[0], demand_allocation[0]))
+    return (None if np.isnan(prices[0]) else float(prices[0])), dict(zip(ids, allocation.tolist())), None
+
+
+def _curves(supply_bids, demand_bids):
+    # Every bid as a one-step curve
+    cleared_bids, clearing_price = Market.market_clearing_curves(
+        supply_curves=[(bid_id, (mwh,), (price,), "step") for bid_id, mwh, price in supply_bids],
+        demand_curves=[(bid_id, (mwh,), (price,), "step") for bid_id, mwh, price in demand_bids],
+    )
+    return clearing_price, _allocations(cleared_bids), _payments(cleared_bids)
+
+
+BACKENDS = {
+    "market_clearing_pure": _pure,
+    "market_clearing_vectorized": _vectorized,
+    "market_allocation_book": _book,
+    "order_book": _order_book,
+    "clear_zone": _zone,
+    "market_clearing_batch": _batch,
+    "market_clearing_curves": _curves,
+    "market_clearing_pure:pay_as_bid": partial(_pure, pricing="pay_as_bid"),
+    "market_clearing_pure:midpoint": partial(_pure, pricing="midpoint"),
+    "market_clearing_vectorized:pay_as_bid": partial(_vectorized, pricing="pay_as_bid"),
+    "market_clearing_vectorized:midpoint": partial(_vectorized, pricing="midpoint"),
+    "order_book:pay_as_bid": partial(_order_book, pricing="pay_as_bid"),
+    "order_book:midpoint": partial(_order_book, pricing="midpoint"),
+    "market_clearing_vectorized:ticks": partial(_vectorized, ticks=TickGrid()),
+    "market_allocation_book:ticks": partial(_book, ticks=TickGrid()),
+    "market_allocation_book:pro_rata": partial(_book, tie_breaking="pro_rata"),
+    "market_allocation_book:random": partial(_book, tie_breaking="random"),
+    "market_allocation_book:ticks+pro_rata": partial(_book, ticks=TickGrid(), tie_breaking="pro_rata"),
+    "clear_zone:pro_rata": partial(_zone, tie_breaking="pro_rata"),
+    "clear_zone:random": partial(_zone, tie_breaking="random"),
+    "clear_zone:ticks+pro_rata": partial(_zone, ticks=TickGrid(), tie_breaking="pro_rata"),
+}
+
+
+def check_pivotal(supply_bids, demand_bids, tolerance: float):
+    """
+    Differences between `pivotal_supplier_analysis` and clearing the book again with the
+    reference without every supply bid in turn, empty if they match.
+    """
+    supply_ids, supply_mwh, supply_price = _columns(supply_bids) if supply_bids else (np.empty(0),) * 3
+    _, demand_mwh, demand_price = _columns(demand_bids) if demand_bids else (np.empty(0),) * 3
+    analysis = pivotal_supplier_analysis(supply_ids, supply_mwh, supply_price, demand_mwh, demand_price)
+
+    differences = []
+    for k, bid_id in enumerate(supply_ids):
+        price, _, _ = _reference(supply_bids[:k] + supply_bids[k + 1:], demand_bids, tolerance=tolerance)
+        expected = np.nan if price is None else price
+        if not np.isclose(expected, analysis.price_without[k], rtol=0, atol=tolerance, equal_nan=True):
+            differences.append(f"price without {bid_id} {expected} != {analysis.price_without[k]}")
+    return differences
+
+
+# Checks of derived analyses, run as backends: (supply_bids, demand_bids, tolerance) -> differences
+CHECKS = {
+    "pivotal_supplier_analysis": check_pivotal,
+}
+
+
+def variant(backend: str):
+    """
+    Pricing rule, tie breaking and use of the tick grid of a backend name "backend:option+option".
+    """
+    options = backend.partition(":")[2].split("+") if ":" in backend else []
+    unknown = set(options) - set(VARIANT_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown backend options: {unknown}")
+    pricing = next((option for option in options if option in PRICING_RULES), "uniform")
+    tie_breaking = next((option for option in options if option in TIE_BREAKING), "time")
+    return pricing, tie_breaking, "ticks" in options
+
+
+def snap(bids, ticks: TickGrid):
+    """
+    Bids rounded to the tick grid, so that the float reference sees the prices the grid sees.
+    """
+    ids, mwh, price = _columns(bids)
+    return list(zip(ids, ticks.from_lots(ticks.to_lots(mwh)).tolist(), ticks.from_ticks(ticks.to_ticks(price)).tolist()))
+
+
+def level_totals(allocation, supply_bids, demand_bids):
+    """
+    Cleared MWh per (side, price level), which tie breaking must not change.
+    """
+    totals = defaultdict(float)
+    for side, bids in ((SELL, supply_bids), (BUY, demand_bids)):
+        for bid_id, _, price in bids:
+            totals[side, price] += allocation.get(bid_id, 0.0)
+    return totals
+
+
+def compare(expected, actual, tolerance: float):
+    """
+    Differences between two (clearing price, allocation, payment) results, empty if they match.
+    Payments are compared when both results have them.
+    """
+    differences = []
+    expected_price, expected_allocation, expected_payment = expected
+    actual_price, actual_allocation, actual_payment = actual
+
+    if (expected_price is None) != (actual_price is None):
+        differences.append(f"price {expected_price} != {actual_price}")
+    elif expected_price is not None and not np.isclose(expected_price, actual_price, rtol=0, atol=tolerance):
+        differences.append(f"price {expected_price} != {actual_price}")
+
+    expected_volume = sum(expected_allocation.values()) / 2
+    actual_volume = sum(actual_allocation.values()) / 2
+    if not np.isclose(expected_volume, actual_volume, rtol=0, atol=tolerance):
+        differences.append(f"volume {expected_volume} != {actual_volume}")
+
+    for bid_id in expected_allocation.keys() | actual_allocation.keys():
+        expected_mwh = expected_allocation.get(bid_id, 0.0)
+        actual_mwh = actual_allocation.get(bid_id, 0.0)
+        if not np.isclose(expected_mwh, actual_mwh, rtol=0, atol=tolerance):
+            differences.append(f"allocation of {bid_id} {expected_mwh} != {actual_mwh}")
+
+    if expected_payment is not None and actual_payment is not None:
+        for bid_id in expected_payment.keys() | actual_payment.keys():
+            expected_amount = expected_payment.get(bid_id, 0.0)
+            actual_amount = actual_payment.get(bid_id, 0.0)
+            if not np.isclose(expected_amount, actual_amount, rtol=0, atol=tolerance * max(1.0, abs(expected_amount))):
+                differences.append(f"payment of {bid_id} {expected_amount} != {actual_amount}")
+
+    return differences
+
+
+def compare_levels(expected, actual, supply_bids, demand_bids, tolerance: float):
+    """
+    Differences of a tie breaking backend: same price and cleared MWh per price level as the
+    reference, and no bid cleared beyond its quantity.
+    """
+    expected_price, expected_allocation, _ = expected
+    actual_price, actual_allocation, _ = actual
+    differences = compare(
+        (expected_price, level_totals(expected_allocation, supply_bids, demand_bids), None),
+        (actual_price, level_totals(actual_allocation, supply_bids, demand_bids), None),
+        tolerance,
+    )
+    for bid_id, mwh, _ in supply_bids + demand_bids:
+        cleared = actual_allocation.get(bid_id, 0.0)
+        if cleared < -tolerance or cleared > mwh + tolerance:
+            differences.append(f"allocation of {bid_id} {cleared} outside [0, {mwh}]")
+    return differences
+
+
+def run(n_books: int, seed: int, max_bids: int, tolerance: float, backends=None, verbose: bool = False):
+    """
+    Clear the regression books and `n_books` books of every kind with the reference and the fast backends.
+
+    Returns:
+    - mismatches: Dict (backend, book kind) -> number of books that did not match.
+    - timings: Dict backend -> total seconds, including "reference".
+    """
+    backends = backends or list(BACKENDS) + list(CHECKS)
+    rng = np.random.default_rng(seed)
+    mismatches = defaultdict(int)
+    timings = defaultdict(float)
+
+    books = [(kind, *book) for kind, book in REGRESSION_BOOKS.items()]
+    books += [(kind, *adversarial_book(kind, rng, max_bids)) for kind in islice(cycle(BOOK_KINDS), n_books)]
+
+    for n, (kind, supply_bids, demand_bids) in enumerate(books):
+        # Reference results by pricing rule and grid, the uniform one is timed
+        books = {False: (supply_bids, demand_bids), True: (snap(supply_bids, TickGrid()), snap(demand_bids, TickGrid()))}
+        references = {}
+        start = time.perf_counter()
+        references["uniform", False] = _reference(supply_bids, demand_bids, "uniform", tolerance)
+        timings["reference"] += time.perf_counter() - start
+
+        for backend in backends:
+            if backend in CHECKS:
+                start = time.perf_counter()
+                differences = CHECKS[backend](supply_bids, demand_bids, tolerance)
+                timings[backend] += time.perf_counter() - start
+                if differences:
+                    mismatches[backend, kind] += 1
+                    if verbose:
+                        print(f"{backend} on {kind} book {n}: " + "; ".join(differences[:5]))
+                continue
+
+            pricing, tie_breaking, on_grid = variant(backend)
+            if (pricing, on_grid) not in references:
+                references[pricing, on_grid] = _reference(*books[on_grid], pricing, tolerance)
+            expected = references[pricing, on_grid]
+            options = {"seed": n} if tie_breaking == "random" else {}
+
+            start = time.perf_counter()
+            actual = BACKENDS[backend](supply_bids, demand_bids, **options)
+            timings[backend] += time.perf_counter() - start
+
+            if tie_breaking == "time":
+                differences = compare(expected, actual, tolerance)
+            else:
+                # Tie breaking must not depend on the order of the bids either
+                shuffle = np.random.default_rng(n)
+                shuffled = BACKENDS[backend](
+                    [supply_bids[i] for i in shuffle.permutation(len(supply_bids))],
+                    [demand_bids[i] for i in shuffle.permutation(len(demand_bids))],
+                    **options,
+                )
+                differences = compare_levels(expected, actual, *books[on_grid], tolerance)
+                differences += [f"shuffled {difference}" for difference in compare(actual, shuffled, tolerance)]
+            if differences:
+                mismatches[backend, kind] += 1
+                if verbose:
+                    print(f"{backend} on {kind} book {n}: " + "; ".join(differences[:5]))
+
+    return mismatches, timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=800, help="number of books, spread over all kinds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-bids", type=int, default=40, help="maximum number of bids per side")
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="absolute tolerance on prices and MWh")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS) + list(CHECKS), help="backends to compare, all by default")
+    parser.add_argument("--verbose", action="store_true", help="print every mismatching book")
+    args = parser.parse_args(argv)
+
+    backends = args.backends or list(BACKENDS) + list(CHECKS)
+    mismatches, timings = run(args.books, args.seed, args.max_bids, args.tolerance, backends, args.verbose)
+
+    print(f"{'backend':<40} {'mismatches':>10} {'time ratio':>11}")
+    for backend in backends:
+        count = sum(n for (b, _), n in mismatches.items() if b == backend)
+        print(f"{backend:<40} {count:>10} {timings[backend] / timings['reference']:>11.2f}")
+        for (b, kind), n in sorted(mismatches.items()):
+            if b == backend:
+                print(f"    {kind}: {n}")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,40 @@
+from dataclasses import dataclass
+
 import phantom as ph
 import gymnasium as gym
 import numpy as np
 from phantom.types import AgentID
 from typing import Iterable, Sequence
-from market_clearing import Market
+from bid_book import BUY, SELL, AgentIndex, BidBook
+from clearing_cache import ClearingCache
+from market_analysis import PivotalAnalysis, pivotal_supplier_analysis
+from market_clearing import PRICING_RULES, TIE_BREAKING, ClearingResult, Market, TickGrid
+from market_coupling import AggregatedCurves, allocate_levels
+from order_book import LimitOrderBook, OrderBook
+from parallel_clearing import clear_zone
 
 # Message Payloads
 ##############################################################
 
 
+class SlottedPayload:
+    """
+    Base of the payloads declaring `__slots__`: instances have no `__dict__`, which keeps
+    the payloads of every hour small, and still pickle although they are frozen.
+    """
+
+    __slots__ = ()
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            object.__setattr__(self, name, value)
+
+
 @ph.msg_payload()
-class BuyBid:
+class BuyBid(SlottedPayload):
     """
     A bid to buy a certain amount of MWh at a certain price.
 
@@ -22,13 +46,15 @@ class BuyBid:
     time:               possibly timestamp for bid?
     """
 
+    __slots__ = ("buyer_id", "mwh", "price")
+
     buyer_id: str
     mwh: int
     price: float
     
 
 @ph.msg_payload()
-class SellBid:
+class SellBid(SlottedPayload):
     """
     A bid to sell a certain amount of MWh at a certain price.
 
@@ -39,14 +65,69 @@ class SellBid:
     price (float):      price of bid
     time:               possibly timestamp for bid?
     """
-    
+
+    __slots__ = ("seller_id", "mwh", "price")
+
     seller_id: str
     mwh: int
     price: float
     
 
 @ph.msg_payload()
-class ClearedBid:
+class BuyCurve:
+    """
+    A demand curve: cumulative MWh breakpoints and the price at every breakpoint,
+    either stepwise or linearly interpolated between the breakpoints.
+
+    Attributes:
+    -----------
+    buyer_id (str):         buyer id
+    mwh (tuple):            cumulative MWh at every breakpoint
+    price (tuple):          price at every breakpoint (non-increasing)
+    interpolation (str):    "step" or "linear"
+    """
+
+    buyer_id: str
+    mwh: tuple
+    price: tuple
+    interpolation: str = "step"
+
+
+@ph.msg_payload()
+class SellCurve:
+    """
+    A supply curve: cumulative MWh breakpoints and the price at every breakpoint,
+    either stepwise or linearly interpolated between the breakpoints.
+
+    Attributes:
+    -----------
+    seller_id (str):        seller id
+    mwh (tuple):            cumulative MWh at every breakpoint
+    price (tuple):          price at every breakpoint (non-decreasing)
+    interpolation (str):    "step" or "linear"
+    """
+
+    seller_id: str
+    mwh: tuple
+    price: tuple
+    interpolation: str = "step"
+
+
+@ph.msg_payload()
+class CancelBid:
+    """
+    Cancel all resting orders of a bidder in a continuous market.
+
+    Attributes:
+    -----------
+    bidder_id (str):    id of the bidder whose orders are cancelled
+    """
+
+    bidder_id: str
+
+
+@ph.msg_payload()
+class ClearedBid(SlottedPayload):
     """
     A cleared bid designating the amount of MWh at which price
     and the id of buyer and seller.
@@ -60,11 +141,58 @@ class ClearedBid:
     time:               possibly timestamp for bid?
     """
 
+    __slots__ = ("seller_id", "buyer_id", "mwh", "price")
+
     seller_id: str
     buyer_id: str
     mwh: int
     price: float
 
+@ph.msg_payload()
+class NetAllocation(SlottedPayload):
+    """
+    Total cleared MWh of one agent in an hour, sent instead of one `ClearedBid`
+    per match when the exchange settles net allocations.
+
+    Attributes:
+    -----------
+    agent_id (str):     id of the settled agent
+    mwh (float):        net MWh, positive if the agent sold and negative if it bought
+    price (float):      uniform clearing price
+    """
+
+    __slots__ = ("agent_id", "mwh", "price")
+
+    agent_id: str
+    mwh: float
+    price: float
+
+@ph.msg_payload()
+class BidColumns:
+    """
+    The `BuyBid` and `SellBid` payloads sent to an agent, gathered into the columns of
+    a `BidBook` by the `ColumnarBatchResolver` as they are pushed.
+
+    Attributes:
+    -----------
+    book (BidBook):     interned bidder, MWh, price and side of every bid
+    """
+
+    book: BidBook
+
+@ph.msg_payload()
+class PopulationBids:
+    """
+    The bids of all members of an agent population in one message, as the columns of
+    a `BidBook` interned with the `AgentIndex` of the exchange.
+
+    Attributes:
+    -----------
+    book (BidBook):     member index, MWh, price and side of every bid
+    """
+
+    book: BidBook
+
 @ph.msg_payload()
 class DummyMsg:
     """
@@ -73,11 +201,280 @@ class DummyMsg:
 
     msg: str
 
+def reuse_bid(cached, payload_type, bidder_id: str, mwh, price):
+    """
+    Payloads are frozen, so an unchanged bid can be sent again instead of built every hour.
+
+    Parameters:
+    - cached: Payload sent previously by the bidder, or None.
+    - payload_type: `BuyBid` or `SellBid`.
+    - bidder_id, mwh, price: Fields of the bid to send.
+
+    Returns:
+    - payload: `cached` if it holds the same bid, otherwise a new payload.
+    """
+    if type(cached) is payload_type and cached.mwh == mwh and cached.price == price:
+        return cached
+    return payload_type(bidder_id, mwh, price)
+
+
+# Message Resolution
+##############################################################
+
+class ColumnarBatchResolver(ph.resolvers.BatchResolver):
+    """
+    Batch resolver that writes the `BuyBid` and `SellBid` payloads sent to the given
+    receivers straight into the NumPy columns of a `BidBook` as they are pushed. The
+    receiver then gets a single `BidColumns` message per round instead of one message
+    per bid, and never reads the payloads one by one.
+
+    Attributes:
+    -----------
+    agent_index:        `AgentIndex` shared with the receivers, used to intern bidder ids
+    receivers (set):    ids of the agents consuming `BidColumns` (e.g. the `ExchangeAgent`)
+    columns (dict):     receiver id -> `BidBook` with the bids of the current round
+    """
+
+    def __init__(self, agent_index: AgentIndex, receivers: Iterable[AgentID], **kwargs):
+        super().__init__(**kwargs)
+        self.agent_index = agent_index
+        self.receivers = set(receivers)
+        self.columns = {receiver_id: BidBook() for receiver_id in self.receivers}
+
+    def handle_push(self, message: ph.Message):
+        book = self.columns.get(message.receiver_id)
+        payload = message.payload
+        if book is None or not isinstance(payload, (BuyBid, SellBid)):
+            return super().handle_push(message)
+
+        # The first bid of a round announces the columns, the receiver empties them once consumed
+        if len(book) == 0:
+            super().handle_push(
+                ph.Message(sender_id=message.sender_id, receiver_id=message.receiver_id, payload=BidColumns(book))
+            )
+
+        if isinstance(payload, SellBid):
+            book.append(self.agent_index.intern(payload.seller_id), payload.mwh, payload.price, SELL)
+        else:
+            book.append(self.agent_index.intern(payload.buyer_id), payload.mwh, payload.price, BUY)
+
+    def reset(self):
+        super().reset()
+        for book in self.columns.values():
+            book.clear()
+
 
 class ExchangeAgent(ph.Agent):
-    def __init__(self, agent_id: str):
+    """
+    Exchange that collects all buy and sell bids of a step and clears them in one auction.
+
+    Attributes:
+    -----------
+    backend (str):      clearing backend, "reference" for the loop in `Market.market_clearing`,
+                        "numpy" for `Market.market_clearing_vectorized` or "order_book" to keep
+                        the bids in a persistent `OrderBook` that is only updated with changed bids
+    agent_index:        `AgentIndex` shared with the env, used to intern bidder ids in the `BidBook`
+    cache_size (int):   size of the LRU cache of clearing results for repeated bid books,
+                        0 disables the cache (requires the "numpy" backend)
+    pricing (str):      pricing rule of the matches, "uniform", "pay_as_bid" or "midpoint"
+    network:            optional `ZonalNetwork`; when given, bids are cleared with transmission
+                        limits and every agent is settled at its zone price against the exchange
+    analyse_pivotal (bool): run `pivotal_supplier_analysis` after every clearing
+    standing_book:      bids of non-strategic agents in merit order, set with `set_standing_bids`;
+                        the bids received every step are merged into it before clearing
+    bid_stage:          FSM stage in which bids are sent; a step without received bids clears
+                        the standing bids only in this stage (never if None)
+    ticks:              optional `TickGrid`; bid books then hold int64 price ticks and MWh lots
+                        and are cleared exactly (requires the "numpy" backend)
+    settlement (str):   "pairs" for two `ClearedBid` messages per match, "net" for one
+                        `NetAllocation` per cleared agent or "view" to send no messages and publish
+                        the result in the `ExchangeView` (both require the "numpy" backend and
+                        uniform pricing)
+    clearing_result:    `ClearingResult` of the last clearing with the numpy backend (surplus, welfare,
+                        unmatched volume, marginal bids), ids are indices of `agent_index`
+    tie_breaking (str): allocation among bids at the same price, one of `TIE_BREAKING`; anything
+                        but "time" allocates per bid and requires "net" or "view" settlement
+    rng:                random generator drawing the seed of every "random" tie breaking, seeded
+                        with `seed` (reseeded by `EL_Clearing_Env.reset(seed=...)`)
+    """
+
+    @dataclass(frozen=True)
+    class ExchangeView(ph.AgentView):
+        """
+        Result of the clearing of the current step, read by the agents from `ctx` instead
+        of receiving messages. The view reads the buffers the exchange currently holds on
+        every access, so a view taken at the start of a step shows the result after message
+        resolution (e.g. in `post_message_resolution`), even if the buffers grew meanwhile.
+
+        Attributes:
+        -----------
+        exchange:                 the `ExchangeAgent` whose buffers are read
+        agent_index:              `AgentIndex` mapping agent ids to positions in `allocation`
+        """
+
+        exchange: "ExchangeAgent"
+        agent_index: AgentIndex
+
+        @property
+        def price(self) -> np.ndarray:
+            """
+            Uniform clearing price as a read-only one-element array, NaN if nothing cleared.
+            """
+            price = self.exchange._view_price.view()
+            price.flags.writeable = False
+            return price
+
+        @property
+        def allocation(self) -> np.ndarray:
+            """
+            Read-only net MWh per agent index, positive if sold and negative if bought.
+            """
+            allocation = self.exchange._view_allocation.view()
+            allocation.flags.writeable = False
+            return allocation
+
+        @property
+        def clearing_price(self):
+            price = float(self.exchange._view_price[0])
+            return None if np.isnan(price) else price
+
+        def mwh(self, agent_id) -> float:
+            """
+            Net MWh of an agent, 0 if it did not clear.
+            """
+            allocation = self.exchange._view_allocation
+            index = self.agent_index.get(agent_id)
+            if index is None or index >= allocation.size:
+                return 0.0
+            return float(allocation[index])
+
+        def mwh_of(self, indices) -> np.ndarray:
+            """
+            Net MWh of the agents at the given indices of `agent_index`, 0 if they did not clear.
+            """
+            allocation = self.exchange._view_allocation
+            indices = np.asarray(indices)
+            mwh = np.zeros(indices.shape)
+            known = indices < allocation.size
+            mwh[known] = allocation[indices[known]]
+            return mwh
+
+    def __init__(
+        self, agent_id: str, backend: str = "reference", agent_index: AgentIndex = None, cache_size: int = 0,
+        pricing: str = "uniform", network=None, analyse_pivotal: bool = False, ticks: TickGrid = None,
+        settlement: str = "pairs", tie_breaking: str = "time", bid_stage=None, seed=None):
         super().__init__(agent_id)
 
+        if backend not in ("reference", "numpy", "order_book"):
+            raise ValueError(f"Unknown clearing backend: {backend}")
+        self.backend = backend
+
+        if pricing not in PRICING_RULES:
+            raise ValueError(f"Unknown pricing rule: {pricing}")
+        self.pricing = pricing
+
+        self.order_book = OrderBook() if backend == "order_book" else None
+
+        if settlement not in ("pairs", "net", "view"):
+            raise ValueError(f"Unknown settlement: {settlement}")
+        if settlement != "pairs" and (backend != "numpy" or pricing != "uniform"):
+            raise ValueError(
+                f"{settlement} settlement requires the numpy backend and uniform pricing, got: {backend}, {pricing}"
+            )
+        self.settlement = settlement
+
+        if tie_breaking not in TIE_BREAKING:
+            raise ValueError(f"Unknown tie breaking: {tie_breaking}")
+        if tie_breaking != "time" and settlement == "pairs":
+            raise ValueError(f"Tie breaking {tie_breaking} requires net settlement, got: {settlement}")
+        self.tie_breaking = tie_breaking
+        self.rng = np.random.default_rng(seed)
+
+        if ticks is not None and backend != "numpy":
+            raise ValueError(f"Tick clearing requires the numpy backend, got: {backend}")
+        self.ticks = ticks
+        book_dtype = np.int64 if ticks is not None else np.float64
+
+        # Bid books are reused every step to avoid reallocating the columns
+        self.agent_index = agent_index if agent_index is not None else AgentIndex()
+        self.bid_book = BidBook(dtype=book_dtype)
+        self.cleared_book = BidBook()
+
+        if cache_size and backend != "numpy":
+            raise ValueError(f"The clearing cache requires the numpy backend, got: {backend}")
+        self.clearing_cache = ClearingCache(cache_size) if cache_size else None
+
+        if network is not None:
+            # Zonal clearing settles every bid against the exchange at its zone price
+            unsupported = [
+                name for name, used in (
+                    ("pricing", pricing != "uniform"), ("settlement", settlement != "pairs"),
+                    ("cache_size", cache_size), ("ticks", ticks is not None), ("analyse_pivotal", analyse_pivotal),
+                ) if used
+            ]
+            if unsupported:
+                raise ValueError(f"Network-constrained clearing does not support: {', '.join(unsupported)}")
+        self.network = network
+        # Zone prices of the last network-constrained clearing
+        self.zone_prices = None
+
+        self.analyse_pivotal = analyse_pivotal
+        # Pivotal supplier analysis of the last clearing
+        self.pivotal_analysis: PivotalAnalysis = None
+
+        self.standing_book: BidBook = None
+        self.bid_stage = bid_stage
+        self.merged_book = BidBook(dtype=book_dtype)
+
+        # Statistics of the last clearing
+        self.clearing_result: ClearingResult = None
+
+        # Buffers behind the `ExchangeView`, updated in place by every clearing
+        self._view_price = np.full(1, np.nan)
+        self._view_allocation = np.zeros(max(len(self.agent_index), 1))
+
+    def view(self, neighbour_id=None) -> ph.View:
+        """@override
+        With "view" settlement the clearing price and the allocation of every agent are
+        exposed to the neighbours, who pull them from `ctx` instead of receiving messages.
+        """
+        if self.settlement != "view":
+            return super().view(neighbour_id)
+
+        return self.ExchangeView(exchange=self, agent_index=self.agent_index)
+
+    def pre_message_resolution(self, ctx: ph.Context):
+        # Agents pulling the result must not see the one of a previous step
+        if self.settlement == "view":
+            self._view_price[0] = np.nan
+            self._view_allocation[:] = 0.0
+
+    def set_standing_bids(self, supply_bids, demand_bids):
+        """
+        Register the fixed bids of non-strategic agents once. They are kept in merit order
+        and every step only the received bids are sorted and inserted, so the agents holding
+        standing bids do not send them anymore (requires the "numpy" backend).
+
+        Parameters:
+        - supply_bids: List of (seller_id, mwh, price) tuples.
+        - demand_bids: List of (buyer_id, mwh, price) tuples.
+        """
+        if self.backend != "numpy":
+            raise ValueError(f"Standing bids require the numpy backend, got: {self.backend}")
+        if self.network is not None:
+            raise ValueError("Standing bids are not supported with network-constrained clearing")
+
+        intern = self.agent_index.intern
+        book = BidBook(len(supply_bids) + len(demand_bids), dtype=self.bid_book.dtype)
+        for bids, side in ((supply_bids, SELL), (demand_bids, BUY)):
+            if len(bids) == 0:
+                continue
+            agent_ids, mwh, price = zip(*bids)
+            if self.ticks is not None:
+                mwh, price = self.ticks.to_lots(mwh), self.ticks.to_ticks(price)
+            book.extend([intern(agent_id) for agent_id in agent_ids], mwh, price, side)
+        self.standing_book = book.merit_order()
+
     @ph.agents.msg_handler(BuyBid)
     def handle_buy_bid(self, ctx: ph.Context, message: ph.Message):
         # Handle a buy bid
@@ -106,28 +503,94 @@ class ExchangeAgent(ph.Agent):
         """
         buy_bids = []
         sell_bids = []
+        columns = None
+        populations = []
 
         msgs = []
 
         # Create lists of buy and sell bids
         for message in batch:
-            if isinstance(message.payload, BuyBid):
+            if isinstance(message.payload, BidColumns):
+                columns = message.payload.book
+            elif isinstance(message.payload, PopulationBids):
+                populations.append(message.payload.book)
+            elif isinstance(message.payload, (BuyBid, BuyCurve)):
                 buy_bids.append(message)
-            elif isinstance(message.payload, SellBid):
+            elif isinstance(message.payload, (SellBid, SellCurve)):
                 sell_bids.append(message)
             else:
                 msgs += self.handle_message(ctx, message)
 
-        if len(buy_bids) > 0 and len(sell_bids) > 0:
+        if populations:
+            msgs = self._clear_populations(populations, columns, buy_bids, sell_bids)
+        elif columns is not None:
+            msgs = self._clear_columns(columns, buy_bids, sell_bids)
+        elif self.standing_book is not None and (buy_bids or sell_bids or self._in_bid_stage(ctx)):
+            msgs = self._clear_standing(buy_bids, sell_bids)
+        elif len(buy_bids) > 0 and len(sell_bids) > 0:
             msgs = self.market_clearing(buy_bids=buy_bids, sell_bids=sell_bids)
 
         return msgs
     
+    def _in_bid_stage(self, ctx: ph.Context) -> bool:
+        # Standing bids alone are cleared once per hour, in the stage where bids are sent
+        return self.bid_stage is not None and getattr(ctx.env_view, "stage", None) == self.bid_stage
+
     def market_clearing(
         self, buy_bids: Sequence[ph.Message[BuyBid]], sell_bids: Sequence[ph.Message[SellBid]]):   
         """
         Encode and decode buy and sell bids and pass to external market clearing mechanism.
+        Steps with curve bids are cleared with `Market.market_clearing_curves`.
+        """
+        if self.network is not None:
+            return self._clear_zonal(buy_bids, sell_bids)
+
+        has_curves = any(isinstance(bid.payload, BuyCurve) for bid in buy_bids) or any(
+            isinstance(bid.payload, SellCurve) for bid in sell_bids
+        )
+
+        if self.analyse_pivotal and not has_curves:
+            self.pivotal_analysis = pivotal_supplier_analysis(
+                supply_ids=[bid.payload.seller_id for bid in sell_bids],
+                supply_mwh=[bid.payload.mwh for bid in sell_bids],
+                supply_price=[bid.payload.price for bid in sell_bids],
+                demand_mwh=[bid.payload.mwh for bid in buy_bids],
+                demand_price=[bid.payload.price for bid in buy_bids],
+            )
+
+        if has_curves:
+            cleared_bids, clearing_price = self._clear_curves(buy_bids, sell_bids)
+            if self.settlement != "pairs":
+                return self._settle_cleared_bids(cleared_bids, clearing_price)
+        elif self.backend == "numpy" and self.settlement != "pairs":
+            allocation, clearing_price = self._clear_vectorized(buy_bids, sell_bids)
+            return self._settle_net(self.bid_book, allocation, clearing_price)
+        elif self.backend == "numpy":
+            cleared_book, clearing_price = self._clear_vectorized(buy_bids, sell_bids)
+            return self._settle_bid_book(cleared_book)
+        elif self.backend == "order_book":
+            cleared_bids, clearing_price = self._clear_order_book(buy_bids, sell_bids)
+        else:
+            cleared_bids, clearing_price = self._clear_reference(buy_bids, sell_bids)
 
+        # DECODING
+        msgs = []
+
+        for cleared_bid in cleared_bids:
+            seller_id, buyer_id, mwh, price = cleared_bid
+            decoded_cleared_bid = ClearedBid(seller_id=seller_id, buyer_id=buyer_id, mwh=mwh, price=price)
+            # Create message for both seller and buyer
+            msg1 = (seller_id, decoded_cleared_bid)
+            msg2 = (buyer_id, decoded_cleared_bid)
+            #logger.debug("Cleared bid between: %s and %s for %s MWh at cost: %s", seller_id, buyer_id, mwh, price)
+            msgs.extend((msg1, msg2))  # TODO: this is possibly wrong
+
+        return msgs
+
+    def _clear_reference(
+        self, buy_bids: Sequence[ph.Message[BuyBid]], sell_bids: Sequence[ph.Message[SellBid]]):
+        """
+        Encode bids as (id, mwh, price) tuples and clear them with the reference loop.
         """
         encoded_buy_bids = []
         encoded_sell_bids = []
@@ -142,31 +605,525 @@ class ExchangeAgent(ph.Agent):
             encoded_sell_bids.append(tuple)
 
         # CLEAR BIDS
-        cleared_bids, clearing_price = Market.market_clearing(supply_bids=encoded_sell_bids, demand_bids=encoded_buy_bids)
+        return Market.market_clearing(supply_bids=encoded_sell_bids, demand_bids=encoded_buy_bids, pricing=self.pricing)
+
+    def _clear_zonal(
+        self, buy_bids: Sequence[ph.Message[BuyBid]], sell_bids: Sequence[ph.Message[SellBid]]):
+        """
+        Clear with the transmission limits of the network. Flows are not bilateral, so the
+        exchange is the counterparty of every cleared bid: sellers are paid and buyers pay
+        the price of their own zone.
+        """
+        # ENCODING
+        seller_ids = [bid.payload.seller_id for bid in sell_bids]
+        buyer_ids = [bid.payload.buyer_id for bid in buy_bids]
+
+        # CLEAR BIDS
+        result = self.network.market_clearing(
+            supply_ids=seller_ids,
+            supply_mwh=[bid.payload.mwh for bid in sell_bids],
+            supply_price=[bid.payload.price for bid in sell_bids],
+            demand_ids=buyer_ids,
+            demand_mwh=[bid.payload.mwh for bid in buy_bids],
+            demand_price=[bid.payload.price for bid in buy_bids],
+        )
+        self.zone_prices = result.zone_prices
 
         # DECODING
         msgs = []
+        zone_prices = result.zone_prices.tolist()
+        for seller_id, zone, mwh in zip(seller_ids, self.network.zones(seller_ids), result.supply_allocation.tolist()):
+            if mwh > 0:
+                msgs.append((seller_id, ClearedBid(seller_id=seller_id, buyer_id=self.id, mwh=mwh, price=zone_prices[zone])))
+        for buyer_id, zone, mwh in zip(buyer_ids, self.network.zones(buyer_ids), result.demand_allocation.tolist()):
+            if mwh > 0:
+                msgs.append((buyer_id, ClearedBid(seller_id=self.id, buyer_id=buyer_id, mwh=mwh, price=zone_prices[zone])))
 
-        for cleared_bid in cleared_bids:
-            buyer_id, seller_id, mwh, price = cleared_bid
-            decoded_cleared_bid = ClearedBid(seller_id=seller_id, buyer_id=buyer_id, mwh=mwh, price=price)
-            # Create message for both seller and buyer
-            msg1 = (seller_id, decoded_cleared_bid)
-            msg2 = (buyer_id, decoded_cleared_bid)
-            #logger.debug("Cleared bid between: %s and %s for %s MWh at cost: %s", seller_id, buyer_id, mwh, price)
-            msgs.extend((msg1, msg2))  # TODO: this is possibly wrong
+        return msgs
+
+    def _clear_curves(
+        self, buy_bids: Sequence[ph.Message], sell_bids: Sequence[ph.Message]):
+        """
+        Encode curve bids (and single bids as one-step curves) and clear the aggregated curves.
+        """
+        # Curves are cleared on their own aggregated grid, none of the bid book options apply
+        unsupported = [
+            name for name, used in (
+                ("pricing", self.pricing != "uniform"), ("cache_size", self.clearing_cache is not None),
+                ("ticks", self.ticks is not None), ("tie_breaking", self.tie_breaking != "time"),
+                ("analyse_pivotal", self.analyse_pivotal),
+            ) if used
+        ]
+        if unsupported:
+            raise ValueError(f"Curve bids do not support: {', '.join(unsupported)}")
+
+        # ENCODING
+        demand_curves = [
+            (bid.payload.buyer_id, bid.payload.mwh, bid.payload.price, bid.payload.interpolation)
+            if isinstance(bid.payload, BuyCurve)
+            else (bid.payload.buyer_id, (bid.payload.mwh,), (bid.payload.price,), "step")
+            for bid in buy_bids
+        ]
+        supply_curves = [
+            (bid.payload.seller_id, bid.payload.mwh, bid.payload.price, bid.payload.interpolation)
+            if isinstance(bid.payload, SellCurve)
+            else (bid.payload.seller_id, (bid.payload.mwh,), (bid.payload.price,), "step")
+            for bid in sell_bids
+        ]
+
+        # CLEAR BIDS
+        return Market.market_clearing_curves(supply_curves=supply_curves, demand_curves=demand_curves)
+
+    def _clear_vectorized(
+        self, buy_bids: Sequence[ph.Message[BuyBid]], sell_bids: Sequence[ph.Message[SellBid]]):
+        """
+        Encode bids into the reused `BidBook` and clear it with the vectorized engine.
+        """
+        return self._clear_book(self._encode_bid_book(buy_bids, sell_bids))
+
+    def _clear_standing(
+        self, buy_bids: Sequence[ph.Message[BuyBid]], sell_bids: Sequence[ph.Message[SellBid]]):
+        """
+        Merge the received bids into the standing bids and clear the merged book,
+        which is already in merit order.
+        """
+        if any(isinstance(bid.payload, (BuyCurve, SellCurve)) for bid in buy_bids + sell_bids):
+            raise ValueError("Curve bids cannot be mixed with standing bids")
+        return self._clear_encoded(self._encode_bid_book(buy_bids, sell_bids))
+
+    def _clear_columns(
+        self, columns: BidBook, buy_bids: Sequence[ph.Message], sell_bids: Sequence[ph.Message]):
+        """
+        Clear the bid columns gathered by the `ColumnarBatchResolver`, without reading
+        any payload. The columns are emptied for the next resolution round.
+        """
+        if self.backend != "numpy":
+            raise ValueError(f"Columnar bid batches require the numpy backend, got: {self.backend}")
+        if self.network is not None:
+            raise ValueError("Columnar bid batches are not supported with network-constrained clearing")
+        if buy_bids or sell_bids:
+            raise ValueError("Curve bids cannot be mixed with columnar bid batches")
+
+        try:
+            book = columns
+            if self.ticks is not None:
+                book = self.bid_book.clear()
+                book.extend(columns.agent, self.ticks.to_lots(columns.mwh), self.ticks.to_ticks(columns.price), columns.side)
+
+            return self._clear_encoded(book)
+        finally:
+            columns.clear()
+
+    def _clear_populations(
+        self, populations: Sequence[BidBook], columns: BidBook, buy_bids: Sequence[ph.Message],
+        sell_bids: Sequence[ph.Message]):
+        """
+        Clear the bids of agent populations together with the bids of single agents
+        (as messages or columns). Population members are not agents and cannot receive
+        messages, so the result is only published in the `ExchangeView`.
+        """
+        if self.settlement != "view":
+            raise ValueError(f"Agent populations require view settlement, got: {self.settlement}")
+        if any(isinstance(bid.payload, (BuyCurve, SellCurve)) for bid in buy_bids + sell_bids):
+            raise ValueError("Curve bids cannot be mixed with agent populations")
+
+        book = self._encode_bid_book(buy_bids, sell_bids)
+        extra = populations if columns is None else [columns] + list(populations)
+        book.reserve(len(book) + sum(len(bids) for bids in extra))
+        for bids in extra:
+            if self.ticks is not None:
+                book.extend(bids.agent, self.ticks.to_lots(bids.mwh), self.ticks.to_ticks(bids.price), bids.side)
+            else:
+                book.extend(bids.agent, bids.mwh, bids.price, bids.side)
+        if columns is not None:
+            columns.clear()
+
+        return self._clear_encoded(book)
+
+    def _analyse_book(self, book: BidBook):
+        """
+        Pivotal supplier analysis of an encoded book, in prices and MWh also for tick books.
+        """
+        mwh, price = book.mwh, book.price
+        if self.ticks is not None:
+            mwh, price = self.ticks.from_lots(mwh), self.ticks.from_ticks(price)
+
+        supply = book.select(SELL)
+        demand = book.select(BUY)
+        self.pivotal_analysis = pivotal_supplier_analysis(
+            supply_ids=self.agent_index.lookup(book.agent[supply]),
+            supply_mwh=mwh[supply],
+            supply_price=price[supply],
+            demand_mwh=mwh[demand],
+            demand_price=price[demand],
+        )
+
+    def _clear_encoded(self, book: BidBook):
+        """
+        Clear an encoded `BidBook`, merged into the standing bids if there are any, and
+        settle it in pairs or per agent.
+        """
+        presorted = self.standing_book is not None
+        if presorted:
+            book = self.standing_book.merge(book, out=self.merged_book)
+
+        if self.settlement != "pairs":
+            allocation, clearing_price = self._clear_book(book, presorted=presorted)
+            msgs = self._settle_net(book, allocation, clearing_price)
+        else:
+            cleared_book, clearing_price = self._clear_book(book, presorted=presorted)
+            msgs = self._settle_bid_book(cleared_book)
+
+        if self.analyse_pivotal:
+            self._analyse_book(book)
+        return msgs
+
+    def _encode_bid_book(
+        self, buy_bids: Sequence[ph.Message[BuyBid]], sell_bids: Sequence[ph.Message[SellBid]]):
+        """
+        Encode bids into the reused `BidBook`.
+        """
+        intern = self.agent_index.intern
+        book = self.bid_book.clear()
+        book.reserve(len(buy_bids) + len(sell_bids))
+
+        # ENCODING
+        n_sell = len(sell_bids)
+        sell_mwh = np.fromiter((bid.payload.mwh for bid in sell_bids), dtype=np.float64, count=n_sell)
+        sell_price = np.fromiter((bid.payload.price for bid in sell_bids), dtype=np.float64, count=n_sell)
+        n_buy = len(buy_bids)
+        buy_mwh = np.fromiter((bid.payload.mwh for bid in buy_bids), dtype=np.float64, count=n_buy)
+        buy_price = np.fromiter((bid.payload.price for bid in buy_bids), dtype=np.float64, count=n_buy)
+        if self.ticks is not None:
+            sell_mwh, sell_price = self.ticks.to_lots(sell_mwh), self.ticks.to_ticks(sell_price)
+            buy_mwh, buy_price = self.ticks.to_lots(buy_mwh), self.ticks.to_ticks(buy_price)
+
+        book.extend(
+            np.fromiter((intern(bid.payload.seller_id) for bid in sell_bids), dtype=np.int32, count=n_sell),
+            sell_mwh, sell_price, SELL,
+        )
+        book.extend(
+            np.fromiter((intern(bid.payload.buyer_id) for bid in buy_bids), dtype=np.int32, count=n_buy),
+            buy_mwh, buy_price, BUY,
+        )
+
+        return book
+
+    def _clear_book(self, book: BidBook, presorted: bool = False):
+        """
+        Clear a `BidBook` with the vectorized engine, through the clearing cache if enabled.
+        Returns the cleared book, or the allocation of every bid under net settlement.
+        """
+        # CLEAR BIDS
+        if self.settlement != "pairs":
+            clear = lambda: Market.market_allocation_book(
+                book, presorted=presorted, log_hook=self._record_result, tie_breaking=self.tie_breaking,
+                seed=self._tie_seed(),
+            )
+        else:
+            clear = lambda: Market.market_clearing_book(
+                book, out=self.cleared_book, pricing=self.pricing, presorted=presorted, log_hook=self._record_result
+            )
+
+        # A cached random tie breaking would repeat the same winners every hour
+        if self.clearing_cache is None or self.tie_breaking == "random":
+            return clear()
+
+        key = book.fingerprint()
+        cached = self.clearing_cache.get(key)
+        if cached is None:
+            cleared, clearing_price = clear()
+            # The cleared book is reused by the next clearing, so the cache keeps a copy
+            cached = (cleared.copy(), clearing_price, self.clearing_result)
+            self.clearing_cache.put(key, cached)
+
+        cleared, clearing_price, self.clearing_result = cached
+        return cleared, clearing_price
+
+    def _tie_seed(self) -> int:
+        # Fresh seed for every clearing, so random tie breaking picks new winners every hour
+        return int(self.rng.integers(2**32)) if self.tie_breaking == "random" else 0
+
+    def _record_result(self, result: ClearingResult):
+        # The env reads the result for rewards, so tick clearings are stored in prices and MWh
+        if self.ticks is not None:
+            result = self.ticks.from_result(result)
+        self.clearing_result = result
+
+    def _settle_net(self, book: BidBook, allocation, clearing_price):
+        """
+        Net the allocation of every bid per agent and send one `NetAllocation`
+        to every agent with cleared volume, or publish them in the `ExchangeView`.
+        """
+        n_agents = len(self.agent_index)
+        signed = np.where(book.side == SELL, allocation, -allocation)
+        net_mwh = np.bincount(book.agent, weights=signed, minlength=n_agents)
+        if self.ticks is not None:
+            net_mwh = self.ticks.from_lots(net_mwh)
+            if clearing_price is not None:
+                clearing_price = float(self.ticks.from_ticks(clearing_price))
+
+        if self.settlement == "view":
+            return self._publish_view(net_mwh, clearing_price)
+
+        traded = np.bincount(book.agent, weights=allocation, minlength=n_agents)
+        return self._net_allocations(net_mwh, traded, clearing_price)
+
+    def _net_allocations(self, net_mwh, traded, clearing_price):
+        """
+        One `NetAllocation` for every agent index with traded volume.
+        """
+        cleared_agents = np.flatnonzero(traded > 0)
+        net_mwh = net_mwh[cleared_agents]
+
+        # DECODING
+        return [
+            (agent_id, NetAllocation(agent_id=agent_id, mwh=mwh, price=clearing_price))
+            for agent_id, mwh in zip(self.agent_index.lookup(cleared_agents), net_mwh.tolist())
+        ]
+
+    def _publish_view(self, net_mwh, clearing_price):
+        """
+        Write the net MWh per agent index and the clearing price into the `ExchangeView` buffers.
+        """
+        # Buffers only grow when new agents bid, views read them through the exchange
+        if net_mwh.size > self._view_allocation.size:
+            self._view_allocation = np.zeros(2 * net_mwh.size)
+        self._view_allocation[:net_mwh.size] = net_mwh
+        self._view_price[0] = np.nan if clearing_price is None else clearing_price
+        return []
+
+    def _settle_cleared_bids(self, cleared_bids, clearing_price):
+        """
+        Net matches given as (seller_id, buyer_id, mwh, price) tuples per agent and send one
+        `NetAllocation` to every agent with cleared volume, or publish them in the `ExchangeView`.
+        """
+        intern = self.agent_index.intern
+        sellers = np.fromiter((intern(seller_id) for seller_id, _, _, _ in cleared_bids), dtype=np.intp, count=len(cleared_bids))
+        buyers = np.fromiter((intern(buyer_id) for _, buyer_id, _, _ in cleared_bids), dtype=np.intp, count=len(cleared_bids))
+        mwh = np.array([cleared_bid[2] for cleared_bid in cleared_bids], dtype=np.float64)
+
+        n_agents = len(self.agent_index)
+        sold = np.bincount(sellers, weights=mwh, minlength=n_agents)
+        bought = np.bincount(buyers, weights=mwh, minlength=n_agents)
+        if self.settlement == "view":
+            return self._publish_view(sold - bought, clearing_price)
+        return self._net_allocations(sold - bought, sold + bought, clearing_price)
+
+    def _settle_bid_book(self, cleared_book: BidBook):
+        """
+        Turn the cleared book (SELL leg followed by BUY leg per match) into
+        `ClearedBid` messages for both seller and buyer.
+        """
+        agent_ids = self.agent_index.lookup(cleared_book.agent)
+        if self.ticks is not None:
+            mwh = self.ticks.from_lots(cleared_book.mwh).tolist()
+            price = self.ticks.from_ticks(cleared_book.price).tolist()
+        else:
+            mwh = cleared_book.mwh.tolist()
+            price = cleared_book.price.tolist()
+
+        # DECODING
+        msgs = []
+        for k in range(0, len(cleared_book), 2):
+            seller_id, buyer_id = agent_ids[k], agent_ids[k + 1]
+            decoded_cleared_bid = ClearedBid(seller_id=seller_id, buyer_id=buyer_id, mwh=mwh[k], price=price[k])
+            msgs.extend(((seller_id, decoded_cleared_bid), (buyer_id, decoded_cleared_bid)))
 
         return msgs
 
+    def _clear_order_book(
+        self, buy_bids: Sequence[ph.Message[BuyBid]], sell_bids: Sequence[ph.Message[SellBid]]):
+        """
+        Update the persistent order book with the bids of this step and clear it.
+        Payloads resent unchanged (see `reuse_bid`) are not read and leave the book untouched.
+        """
+        self.order_book.sync_payloads(
+            supply_payloads=[bid.payload for bid in sell_bids],
+            demand_payloads=[bid.payload for bid in buy_bids],
+        )
+
+        return self.order_book.market_clearing(pricing=self.pricing)
+
+class ContinuousExchangeAgent(ph.Agent):
+    """
+    Intraday exchange running a continuous double auction. Every `BuyBid`/`SellBid` is
+    matched on arrival against the resting orders under price-time priority, partial
+    fills rest in the book across steps and `CancelBid` withdraws a bidder's resting orders.
+    Each fill is reported to both parties as a `ClearedBid` at the resting order's price.
+    """
+
+    def __init__(self, agent_id: str):
+        super().__init__(agent_id)
+
+        self.order_book = LimitOrderBook()
+
+    def handle_batch(
+        self, ctx: ph.Context, batch: Sequence[ph.Message]):
+        """@override
+        Messages are processed in the order they arrive, which gives the time priority.
+        """
+        msgs = []
+
+        for message in batch:
+            payload = message.payload
+            if isinstance(payload, BuyBid):
+                _, fills = self.order_book.submit(payload.buyer_id, BUY, payload.mwh, payload.price)
+            elif isinstance(payload, SellBid):
+                _, fills = self.order_book.submit(payload.seller_id, SELL, payload.mwh, payload.price)
+            elif isinstance(payload, CancelBid):
+                self.order_book.cancel_owner(payload.bidder_id)
+                continue
+            else:
+                msgs += self.handle_message(ctx, message)
+                continue
+
+            # DECODING
+            for seller_id, buyer_id, mwh, price in fills:
+                cleared_bid = ClearedBid(seller_id=seller_id, buyer_id=buyer_id, mwh=mwh, price=price)
+                msgs.extend(((seller_id, cleared_bid), (buyer_id, cleared_bid)))
+
+        return msgs
+
+    def reset(self):
+        super().reset()
+        self.order_book = LimitOrderBook()
+
+class MultiZoneExchangeAgent(ExchangeAgent):
+    """
+    Exchange running independent bidding zones. The bids of every zone are cleared on
+    their own, in parallel on a `ZoneClearingPool` when one is given (large zones go to
+    the pool, small ones are cleared in process). With a `MarketCoupling` the zones are
+    instead cleared jointly over their interconnectors. The exchange is the counterparty
+    of every cleared bid, which is settled at the price of its zone.
+
+    Attributes:
+    -----------
+    zone_of (dict):     agent id -> zone index
+    n_zones (int):      number of zones
+    pool:               optional `ZoneClearingPool`, cleared with the tie breaking of the exchange
+    coupling:           optional `MarketCoupling` of the zones
+    coupling_result:    `CouplingResult` of the last coupled clearing
+    tie_breaking (str): allocation among bids at the same price of a zone, one of `TIE_BREAKING`
+    """
+
+    def __init__(
+        self, agent_id: str, zone_of: dict, pool=None, agent_index: AgentIndex = None, coupling=None,
+        tie_breaking: str = "time", seed=None):
+        super().__init__(agent_id, backend="numpy", agent_index=agent_index, seed=seed)
+
+        # Every bid is settled on its own allocation, so any tie breaking works here
+        if tie_breaking not in TIE_BREAKING:
+            raise ValueError(f"Unknown tie breaking: {tie_breaking}")
+        self.tie_breaking = tie_breaking
+
+        self.zone_of = dict(zone_of)
+        self.n_zones = max(self.zone_of.values(), default=-1) + 1
+        self.pool = pool
+
+        if coupling is not None and coupling.n_zones != self.n_zones:
+            raise ValueError(f"Coupling has {coupling.n_zones} zones, the exchange has {self.n_zones}")
+        self.coupling = coupling
+        self.coupling_result = None
+
+        # One reused bid book per zone and the prices of the last clearing
+        self.zone_books = [BidBook() for _ in range(self.n_zones)]
+        self.zone_prices = np.full(self.n_zones, np.nan)
+
+    def market_clearing(
+        self, buy_bids: Sequence[ph.Message[BuyBid]], sell_bids: Sequence[ph.Message[SellBid]]):
+        """
+        Split the bids by zone, clear every zone and settle each agent at its zone price.
+        """
+        intern = self.agent_index.intern
+        for book in self.zone_books:
+            book.clear()
+
+        # ENCODING
+        for bid in sell_bids:
+            self.zone_books[self.zone_of[bid.payload.seller_id]].append(
+                intern(bid.payload.seller_id), bid.payload.mwh, bid.payload.price, SELL
+            )
+        for bid in buy_bids:
+            self.zone_books[self.zone_of[bid.payload.buyer_id]].append(
+                intern(bid.payload.buyer_id), bid.payload.mwh, bid.payload.price, BUY
+            )
+
+        # CLEAR BIDS
+        seed = self._tie_seed()
+        if self.coupling is not None:
+            allocations = self._clear_coupled(seed)
+        elif self.pool is not None:
+            self.zone_prices, allocations = self.pool.clear(self.zone_books, seed=seed, tie_breaking=self.tie_breaking)
+        else:
+            cleared = [
+                clear_zone(book.mwh, book.price, book.side, self.tie_breaking, seed=seed + z, key=book.agent)
+                for z, book in enumerate(self.zone_books)
+            ]
+            self.zone_prices = np.array([price for price, _ in cleared])
+            allocations = [allocation for _, allocation in cleared]
+
+        # DECODING
+        msgs = []
+        for book, price, allocation in zip(self.zone_books, self.zone_prices.tolist(), allocations):
+            cleared_idx = np.flatnonzero(allocation > 0)
+            agent_ids = self.agent_index.lookup(book.agent[cleared_idx])
+            for agent_id, side, mwh in zip(agent_ids, book.side[cleared_idx].tolist(), allocation[cleared_idx].tolist()):
+                if side == SELL:
+                    msgs.append((agent_id, ClearedBid(seller_id=agent_id, buyer_id=self.id, mwh=mwh, price=price)))
+                else:
+                    msgs.append((agent_id, ClearedBid(seller_id=self.id, buyer_id=agent_id, mwh=mwh, price=price)))
+
+        return msgs
+
+    def _clear_coupled(self, seed: int = 0):
+        """
+        Couple the aggregated curves of all zones and distribute the cleared MWh of every
+        price level over the bids at that level, with the tie breaking of the exchange.
+        """
+        sides = [(book.side == SELL, book.side == BUY) for book in self.zone_books]
+        zone_curves = [
+            AggregatedCurves.from_bids(book.mwh[sell], book.price[sell], book.mwh[buy], book.price[buy])
+            for book, (sell, buy) in zip(self.zone_books, sides)
+        ]
+        self.coupling_result = self.coupling.clear(zone_curves)
+        self.zone_prices = self.coupling_result.zone_prices
+
+        allocations = []
+        for z, (book, curves, (sell, buy)) in enumerate(zip(self.zone_books, zone_curves, sides)):
+            allocation = np.zeros(book.size)
+            allocation[sell] = allocate_levels(
+                book.mwh[sell], book.price[sell], curves.supply_price, self.coupling_result.supply_cleared[z]
+            )
+            # Demand is allocated highest price first
+            allocation[buy] = allocate_levels(
+                book.mwh[buy], -book.price[buy], -curves.demand_price, self.coupling_result.demand_cleared[z]
+            )
+            if self.tie_breaking != "time":
+                for rows in (sell, buy):
+                    allocation[rows] = Market.break_ties(
+                        book.mwh[rows], book.price[rows], allocation[rows], self.tie_breaking, seed + z,
+                        key=book.agent[rows],
+                    )
+            allocations.append(allocation)
+        return allocations
+
 # Simple Generator Agent for development
 class GeneratorAgent(ph.Agent):
-    def __init__(self, agent_id: str, exchange_id: str, capacity: int, price: float):
+    def __init__(
+        self, agent_id: str, exchange_id: str, capacity: int, price: float, standing: bool = False,
+        reuse_payloads: bool = True):
         super().__init__(agent_id)
 
         # Store the ID of the Exchange that Bids go through
         self.exchange_id = exchange_id
         self.capacity = capacity
         self.price = price
+        # Standing bids are registered with the exchange once instead of sent every step
+        self.standing = standing
+        # The last bid is sent again while capacity and price do not change
+        self.reuse_payloads = reuse_payloads
+        self._bid: SellBid = None
 
         self.capacity_left: int = 0
 
@@ -175,7 +1132,12 @@ class GeneratorAgent(ph.Agent):
 
     # Generate supply bid 
     def generate_messages(self, ctx: ph.Context):
-        return [(self.exchange_id, SellBid(self.id, self.capacity, self.price))]
+        if self.standing:
+            return []
+        if not self.reuse_payloads:
+            return [(self.exchange_id, SellBid(self.id, self.capacity, self.price))]
+        self._bid = reuse_bid(self._bid, SellBid, self.id, self.capacity, self.price)
+        return [(self.exchange_id, self._bid)]
 
     @ph.agents.msg_handler(ClearedBid)
     def handle_cleared_bid(self, _ctx: ph.Context, msg: ph.Message):
@@ -183,23 +1145,55 @@ class GeneratorAgent(ph.Agent):
         self.capacity_left -= msg.payload.mwh
         #logger.debug("Generator Agent %s supplies: %s to %s at price %s", self.id, msg.payload.mwh, msg.payload.buyer_id, msg.payload.price)
 
+    @ph.agents.msg_handler(NetAllocation)
+    def handle_net_allocation(self, _ctx: ph.Context, msg: ph.Message):
+        self.supplied_capacity = msg.payload.mwh
+        self.capacity_left -= msg.payload.mwh
+
     def pre_message_resolution(self, ctx: ph.Context):
         self.capacity_left = self.capacity
         self.supplied_capacity = 0
         self.missed_capacity = 0
 
     def post_message_resolution(self, ctx: ph.Context):
+        # With "view" settlement the exchange sends no messages, the result is read from its view
+        view = ctx.agent_views.get(self.exchange_id)
+        if isinstance(view, ExchangeAgent.ExchangeView):
+            self.supplied_capacity = view.mwh(self.id)
+            self.capacity_left = self.capacity - self.supplied_capacity
         self.missed_capacity = self.capacity_left
 
+# Generator bidding a whole cost curve with a single message
+class CurveGeneratorAgent(GeneratorAgent):
+    def __init__(
+        self, agent_id: str, exchange_id: str, mwh: Sequence[float], price: Sequence[float],
+        interpolation: str = "step"):
+        super().__init__(agent_id, exchange_id, capacity=mwh[-1], price=price[-1])
+
+        # Cumulative MWh and price breakpoints of the cost curve
+        self.curve_mwh = tuple(mwh)
+        self.curve_price = tuple(price)
+        self.interpolation = interpolation
+
+    def generate_messages(self, ctx: ph.Context):
+        return [(self.exchange_id, SellCurve(self.id, self.curve_mwh, self.curve_price, self.interpolation))]
+
 # Simple Demand Agent for development
 class SimpleDemandAgent(ph.Agent):
-    def __init__(self, agent_id: str, exchange_id: str, demand: int, price: float):
+    def __init__(
+        self, agent_id: str, exchange_id: str, demand: int, price: float, standing: bool = False,
+        reuse_payloads: bool = True):
         super().__init__(agent_id)
 
         # Store the ID of the Exchange that Bids go through
         self.exchange_id = exchange_id
         self.demand = demand
         self.price = price
+        # Standing bids are registered with the exchange once instead of sent every step
+        self.standing = standing
+        # The last bid is sent again while demand and price do not change
+        self.reuse_payloads = reuse_payloads
+        self._bid: BuyBid = None
 
         self.demand_left: int = 0
 
@@ -211,7 +1205,12 @@ class SimpleDemandAgent(ph.Agent):
 
 
     def generate_messages(self, ctx: ph.Context):
-        return [(self.exchange_id, BuyBid(self.id, self.demand, self.price))]
+        if self.standing:
+            return []
+        if not self.reuse_payloads:
+            return [(self.exchange_id, BuyBid(self.id, self.demand, self.price))]
+        self._bid = reuse_bid(self._bid, BuyBid, self.id, self.demand, self.price)
+        return [(self.exchange_id, self._bid)]
     
     @ph.agents.msg_handler(ClearedBid)
     def handle_cleared_bid(self, _ctx: ph.Context, msg: ph.Message):
@@ -219,17 +1218,145 @@ class SimpleDemandAgent(ph.Agent):
         self.demand_left -= msg.payload.mwh
         #logger.debug("Customer Agent %s receives: %s from %s at price %s", self.id, msg.payload.mwh, msg.payload.seller_id, msg.payload.price)
 
+    @ph.agents.msg_handler(NetAllocation)
+    def handle_net_allocation(self, _ctx: ph.Context, msg: ph.Message):
+        # Bought volume is negative in a net allocation
+        self.satisfied_demand = -msg.payload.mwh
+        self.demand_left += msg.payload.mwh
+
     def pre_message_resolution(self, ctx: ph.Context):
         self.demand_left = self.demand
         self.satisfied_demand = 0
         self.missed_demand = 0
 
     def post_message_resolution(self, ctx: ph.Context):
+        view = ctx.agent_views.get(self.exchange_id)
+        if isinstance(view, ExchangeAgent.ExchangeView):
+            # Bought volume is negative in the allocation
+            self.satisfied_demand = -view.mwh(self.id)
+            self.demand_left = self.demand - self.satisfied_demand
         self.missed_demand = self.demand_left
     
     def reset(self):
         self.demand_left = 0
 
+class AgentPopulation(ph.Agent):
+    """
+    Many fixed bidders on the same side of the market held by one agent. Their bids are
+    sent as one `PopulationBids` message and their results are read from the
+    `ExchangeView` in one vectorized update (requires "view" settlement), so an hour
+    costs a constant number of Python calls instead of a few per member.
+
+    Attributes:
+    -----------
+    exchange_id (str):      id of the exchange the bids go through
+    member_ids (tuple):     ids of the members, interned in the `AgentIndex` of the exchange
+    member_index:           index of every member in that `AgentIndex`
+    mwh (np.ndarray):       MWh bid by every member
+    price (np.ndarray):     price bid by every member
+    cleared (np.ndarray):   MWh cleared for every member in the current step
+    left (np.ndarray):      MWh not cleared for every member in the current step
+    missed (np.ndarray):    MWh missed by every member after message resolution
+    """
+
+    side = SELL
+
+    def __init__(
+        self, agent_id: str, exchange_id: str, agent_index: AgentIndex, member_ids: Sequence[str],
+        mwh: Sequence[float], price: Sequence[float]):
+        super().__init__(agent_id)
+
+        self.exchange_id = exchange_id
+        self.member_ids = tuple(member_ids)
+        self._position = {member_id: i for i, member_id in enumerate(self.member_ids)}
+        self.member_index = np.fromiter(
+            (agent_index.intern(member_id) for member_id in self.member_ids), dtype=np.int32, count=len(self.member_ids)
+        )
+        self.mwh = np.asarray(mwh, dtype=np.float64)
+        self.price = np.asarray(price, dtype=np.float64)
+        if not (self.member_index.size == self.mwh.size == self.price.size):
+            raise ValueError(
+                f"Expected one MWh and price per member, got: {self.member_index.size}, {self.mwh.size}, {self.price.size}"
+            )
+
+        # The bids never change, the same columns are sent every step
+        self.bids = BidBook(self.member_index.size)
+        self.bids.extend(self.member_index, self.mwh, self.price, self.side)
+
+        self.cleared = np.zeros(self.mwh.size)
+        self.left = np.zeros(self.mwh.size)
+        self.missed = np.zeros(self.mwh.size)
+
+    def generate_messages(self, ctx: ph.Context):
+        return [(self.exchange_id, PopulationBids(self.bids))]
+
+    def pre_message_resolution(self, ctx: ph.Context):
+        self.left[:] = self.mwh
+        self.cleared[:] = 0
+        self.missed[:] = 0
+
+    def post_message_resolution(self, ctx: ph.Context):
+        view = ctx.agent_views.get(self.exchange_id)
+        if isinstance(view, ExchangeAgent.ExchangeView):
+            # Bought volume is negative in the allocation
+            net_mwh = view.mwh_of(self.member_index)
+            self.cleared[:] = net_mwh if self.side == SELL else -net_mwh
+            np.subtract(self.mwh, self.cleared, out=self.left)
+        self.missed[:] = self.left
+
+    def member(self, member_id: str) -> dict:
+        """
+        Bid and result of a single member.
+        """
+        i = self._position[member_id]
+        return {
+            "mwh": float(self.mwh[i]),
+            "price": float(self.price[i]),
+            "cleared": float(self.cleared[i]),
+            "left": float(self.left[i]),
+            "missed": float(self.missed[i]),
+        }
+
+# Population of fixed generators, the vectorized counterpart of `GeneratorAgent`
+class GeneratorPopulation(AgentPopulation):
+    side = SELL
+
+    @property
+    def capacity(self):
+        return self.mwh
+
+    @property
+    def supplied_capacity(self):
+        return self.cleared
+
+    @property
+    def capacity_left(self):
+        return self.left
+
+    @property
+    def missed_capacity(self):
+        return self.missed
+
+# Population of fixed consumers, the vectorized counterpart of `SimpleDemandAgent`
+class DemandPopulation(AgentPopulation):
+    side = BUY
+
+    @property
+    def demand(self):
+        return self.mwh
+
+    @property
+    def satisfied_demand(self):
+        return self.cleared
+
+    @property
+    def demand_left(self):
+        return self.left
+
+    @property
+    def missed_demand(self):
+        return self.missed
+
 class DummyAgent(ph.StrategicAgent):
     def __init__(self, agent_id: ph.AgentID):
         super().__init__(agent_id)
@@ -2,10 +2,18 @@ import phantom as ph
 import gymnasium as gym
 import numpy as np
 
-from elmarket_agents import DummyAgent, ExchangeAgent, GeneratorAgent, SimpleDemandAgent
+from bid_book import AgentIndex
+from elmarket_agents import (
+    ColumnarBatchResolver, DemandPopulation, DummyAgent, ExchangeAgent, GeneratorAgent, GeneratorPopulation,
+    SimpleDemandAgent,
+)
 
 class EL_Clearing_Env(ph.FiniteStateMachineEnv):
-    def __init__(self, num_steps=24, **kwargs):
+    def __init__(
+        self, num_steps=24, clearing_backend="reference", clearing_cache_size=0, pricing="uniform",
+        pivotal_analysis=False, standing_bids=False, ticks=None, settlement="pairs",
+        tie_breaking="time", columnar_batches=False, agent_populations=False,
+        reuse_payloads=True, **kwargs):
         # TODO: Add multiple buyers and sellers
   
         # Predefine supply and demand bids
@@ -26,19 +34,45 @@ class EL_Clearing_Env(ph.FiniteStateMachineEnv):
         generator_ids = [f"G{i+1}" for i in range(len(supply_bids))]
         buyer_ids = [f"D{i+1}" for i in range(len(demand_bids))]
 
+        # Intern agent IDs once for the whole env
+        self.agent_index = AgentIndex(["ExchangeAgent", "DummyAgent"] + generator_ids + buyer_ids)
+
         # Initiate Agents
         dummy_agent = DummyAgent("DummyAgent")
-        exchange_agent = ExchangeAgent("ExchangeAgent")
-        generator_agents = []
-        for gid, mwh, price in supply_bids:
-            generator_agents.append(GeneratorAgent(gid, "ExchangeAgent", mwh, price))
-        buyer_agents = []
-        for id, mwh, price in demand_bids:
-            buyer_agents.append(SimpleDemandAgent(id, "ExchangeAgent", mwh, price))
+        exchange_agent = ExchangeAgent(
+            "ExchangeAgent", backend=clearing_backend, agent_index=self.agent_index,
+            cache_size=clearing_cache_size, pricing=pricing, analyse_pivotal=pivotal_analysis, ticks=ticks,
+            settlement=settlement, tie_breaking=tie_breaking, bid_stage="Bid Stage",
+        )
+        if agent_populations:
+            # All generators and all buyers bid and settle as one agent each (requires view settlement)
+            if settlement != "view" or standing_bids:
+                raise ValueError("Agent populations require view settlement and no standing bids")
+            generator_agents = [GeneratorPopulation(
+                "Generators", "ExchangeAgent", self.agent_index, *zip(*supply_bids)
+            )]
+            buyer_agents = [DemandPopulation(
+                "Consumers", "ExchangeAgent", self.agent_index, *zip(*demand_bids)
+            )]
+            generator_ids = ["Generators"]
+            buyer_ids = ["Consumers"]
+        else:
+            generator_agents = []
+            for gid, mwh, price in supply_bids:
+                generator_agents.append(GeneratorAgent(
+                    gid, "ExchangeAgent", mwh, price, standing=standing_bids, reuse_payloads=reuse_payloads
+                ))
+            buyer_agents = []
+            for id, mwh, price in demand_bids:
+                buyer_agents.append(SimpleDemandAgent(
+                    id, "ExchangeAgent", mwh, price, standing=standing_bids, reuse_payloads=reuse_payloads
+                ))
 
         # Define Network and create connections between Actors
         agents = [exchange_agent, dummy_agent] + generator_agents + buyer_agents
-        network = ph.Network(agents)
+        # Columnar batches hand the exchange all bids as NumPy columns (requires the numpy backend)
+        resolver = ColumnarBatchResolver(self.agent_index, ["ExchangeAgent"]) if columnar_batches else None
+        network = ph.Network(agents, resolver=resolver)
 
         # Connect the agents
         network.add_connection("ExchangeAgent", "DummyAgent")
@@ -68,4 +102,22 @@ class EL_Clearing_Env(ph.FiniteStateMachineEnv):
             initial_stage="Bid Stage",
             stages=stages,
             **kwargs,
-        )
\ No newline at end of file
+        )
+
+    def reset(self, **kwargs):
+        """
+        Rebuild the standing bids of the non-strategic agents once per episode, only the
+        bids of the strategic agents are then merged into them every hour.
+        """
+        exchange_agent = self.agents["ExchangeAgent"]
+        if kwargs.get("seed") is not None:
+            # Random tie breaking is reproducible per episode seed
+            exchange_agent.rng = np.random.default_rng(kwargs["seed"])
+        standing = [agent for agent in self.agents.values() if getattr(agent, "standing", False)]
+        if standing:
+            exchange_agent.set_standing_bids(
+                supply_bids=[(a.id, a.capacity, a.price) for a in standing if isinstance(a, GeneratorAgent)],
+                demand_bids=[(a.id, a.demand, a.price) for a in standing if isinstance(a, SimpleDemandAgent)],
+            )
+
+        return super().reset(**kwargs)
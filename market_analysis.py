@@ -0,0 +1,104 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from market_clearing import Market
+
+
+@dataclass(frozen=True)
+class PivotalAnalysis:
+    """
+    Market power indicators of the supply bids of one clearing, in input order.
+
+    Attributes:
+    -----------
+    supply_ids (list):                  supply bid ids
+    clearing_price (float):             uniform clearing price with all bids, NaN if the curves do not cross
+    cleared_mwh (float):                cleared volume with all bids
+    price_without (np.ndarray):         clearing price if the bid is withheld, NaN if nothing clears
+    price_impact (np.ndarray):          price_without - clearing_price
+    residual_supply_index (np.ndarray): supply capacity of all other bids over the cleared volume
+    pivotal (np.ndarray):               True if the other bids cannot cover the cleared volume
+    """
+
+    supply_ids: list
+    clearing_price: float
+    cleared_mwh: float
+    price_without: np.ndarray
+    price_impact: np.ndarray
+    residual_supply_index: np.ndarray
+    pivotal: np.ndarray
+
+
+def pivotal_supplier_analysis(supply_ids, supply_mwh, supply_price, demand_mwh, demand_price):
+    """
+    Clearing price with every supply bid removed in turn, in O(n log n) for all bids at once.
+
+    In merit order, supply bid i clears (at least partly) if the supply before it is less
+    than the demand willing to pay its price: C[i-1] < D(s[i]). The gap g[i] = C[i-1] - D(s[i])
+    is non-decreasing, and withholding bid k lowers C[i-1] by q[k] for every bid after k.
+    The marginal bid without k is therefore the last i > k with g[i] < q[k], found with a
+    single searchsorted over g, or the bid just before k if none follows. Zero-quantity
+    bids are left out of the merit order, as they can never be the marginal bid.
+
+    Parameters:
+    - supply_ids: Sequence of supply bid ids.
+    - supply_mwh, supply_price: Arrays describing the supply bids.
+    - demand_mwh, demand_price: Arrays describing the demand bids.
+
+    Returns:
+    - analysis: PivotalAnalysis
+    """
+    supply_mwh = np.asarray(supply_mwh, dtype=np.float64)
+    supply_price = np.asarray(supply_price, dtype=np.float64)
+    demand_mwh = np.asarray(demand_mwh, dtype=np.float64)
+    demand_price = np.asarray(demand_price, dtype=np.float64)
+    n_supply = supply_mwh.size
+
+    _, _, matched_mwh, clearing_price = Market.merit_order(supply_mwh, supply_price, demand_mwh, demand_price)
+    clearing_price = np.nan if clearing_price is None else clearing_price
+    cleared_mwh = float(matched_mwh.sum())
+
+    # Zero-quantity bids never clear, withholding them leaves the full-book price
+    price_without = np.full(n_supply, clearing_price)
+    offered = np.flatnonzero(supply_mwh > 0)
+    if offered.size and demand_mwh.size:
+        # Step 1: Merit order, supply before every bid and demand willing to pay its price
+        order = offered[np.argsort(supply_price[offered], kind="stable")]
+        sorted_price = supply_price[order]
+        sorted_mwh = supply_mwh[order]
+        supply_before = np.cumsum(sorted_mwh) - sorted_mwh
+
+        demand_order = np.argsort(demand_price, kind="stable")
+        demand_at_least = np.cumsum(demand_mwh[demand_order][::-1])[::-1]
+        first_affordable = np.searchsorted(demand_price[demand_order], sorted_price, side="left")
+        demand_at_price = np.append(demand_at_least, 0.0)[first_affordable]
+
+        gap = supply_before - demand_at_price
+
+        # Step 2: Marginal bid with bid k withheld (gaps equal up to float dust count as closed)
+        tolerance = 1e-9 * max(1.0, float(sorted_mwh.sum()))
+        position = np.arange(order.size)
+        last_after = np.searchsorted(gap, sorted_mwh - tolerance, side="left") - 1
+        n_accepted = np.searchsorted(gap, -tolerance, side="left")
+        marginal = np.where(last_after > position, last_after, np.minimum(position, n_accepted) - 1)
+
+        # Bids that do not clear leave the result unchanged
+        dispatched = position < n_accepted
+        sorted_price_without = np.where(marginal >= 0, sorted_price[np.maximum(marginal, 0)], np.nan)
+        sorted_price_without = np.where(dispatched, sorted_price_without, clearing_price)
+        price_without[order] = sorted_price_without
+
+    other_supply = supply_mwh.sum() - supply_mwh
+    with np.errstate(divide="ignore", invalid="ignore"):
+        residual_supply_index = np.where(cleared_mwh > 0, other_supply / cleared_mwh, np.inf)
+
+    return PivotalAnalysis(
+        supply_ids=list(supply_ids),
+        clearing_price=clearing_price,
+        cleared_mwh=cleared_mwh,
+        price_without=price_without,
+        price_impact=price_without - clearing_price,
+        residual_supply_index=residual_supply_index,
+        pivotal=other_supply < cleared_mwh,
+    )
@@ -1,31 +1,179 @@
+from dataclasses import dataclass, replace
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+from bid_book import BUY, SELL, BidBook
+
+
+# Pricing rules supported by the clearing engines:
+# - uniform: every match settles at the marginal (clearing) price
+# - pay_as_bid: every match settles at the price of its supply bid (sellers are paid as offered)
+# - midpoint: every match settles halfway between its supply and demand bid prices
+PRICING_RULES = ("uniform", "pay_as_bid", "midpoint")
+
+# Allocation among bids at the same price level (see `Market.break_ties`):
+# - time: merit order with submission order inside a level, as in the loop
+# - pro_rata: the cleared MWh of a level are shared in proportion to the bid sizes
+# - random: bids of a level are filled in a random order drawn from a fixed seed
+TIE_BREAKING = ("time", "pro_rata", "random")
+
+
+@dataclass(frozen=True)
+class TickGrid:
+    """
+    Fixed-point grid of the clearing. Prices are whole multiples of `price_tick` and
+    quantities whole multiples of `mwh_lot`, both stored as int64 so that ties, remainders
+    and cache keys are exact. Values are rounded to the nearest tick or lot.
+
+    Attributes:
+    -----------
+    price_tick (float): price increment, e.g. 0.01 EUR/MWh
+    mwh_lot (float):    quantity increment, e.g. 0.1 MWh
+    """
+
+    price_tick: float = 0.01
+    mwh_lot: float = 0.1
+
+    def to_ticks(self, price):
+        return np.rint(np.asarray(price, dtype=np.float64) / self.price_tick).astype(np.int64)
+
+    def to_lots(self, mwh):
+        return np.rint(np.asarray(mwh, dtype=np.float64) / self.mwh_lot).astype(np.int64)
+
+    def from_ticks(self, ticks):
+        return np.asarray(ticks, dtype=np.float64) * self.price_tick
+
+    def from_lots(self, lots):
+        return np.asarray(lots, dtype=np.float64) * self.mwh_lot
+
+    def from_result(self, result):
+        """
+        `ClearingResult` of a tick clearing with prices, MWh and surplus converted back.
+        """
+        def scale(value, factor):
+            return None if value is None else float(value) * factor
+
+        surplus = self.price_tick * self.mwh_lot
+        return replace(
+            result,
+            matched_mwh=self.from_lots(result.matched_mwh),
+            clearing_price=scale(result.clearing_price, self.price_tick),
+            settlement_price=None if result.settlement_price is None else self.from_ticks(result.settlement_price),
+            consumer_surplus=scale(result.consumer_surplus, surplus),
+            producer_surplus=scale(result.producer_surplus, surplus),
+            unmatched_supply_mwh=scale(result.unmatched_supply_mwh, self.mwh_lot),
+            unmatched_demand_mwh=scale(result.unmatched_demand_mwh, self.mwh_lot),
+        )
+
+
+@dataclass(frozen=True)
+class ClearingResult:
+    """
+    Result of a market clearing. The statistics are computed from the matches of the
+    same clearing pass, None when the engine did not compute them.
+
+    Attributes:
+    -----------
+    supply_ids (Sequence):      supply bid id of every match
+    demand_ids (Sequence):      demand bid id of every match
+    matched_mwh (np.ndarray):   matched MWh of every match
+    clearing_price (float):     uniform market clearing price, None if the curves do not cross
+    settlement_price (np.ndarray): settlement price of every match, None under uniform pricing
+    consumer_surplus (float):   sum over matches of (demand price - settlement price) * MWh
+    producer_surplus (float):   sum over matches of (settlement price - supply price) * MWh
+    unmatched_supply_mwh (float): offered MWh that was not cleared
+    unmatched_demand_mwh (float): demanded MWh that was not cleared
+    """
+
+    supply_ids: Sequence
+    demand_ids: Sequence
+    matched_mwh: np.ndarray
+    clearing_price: Optional[float]
+    settlement_price: Optional[np.ndarray] = None
+    consumer_surplus: Optional[float] = None
+    producer_surplus: Optional[float] = None
+    unmatched_supply_mwh: Optional[float] = None
+    unmatched_demand_mwh: Optional[float] = None
+
+    @property
+    def cleared_bids(self):
+        """
+        Matches as tuples (supply_id, demand_id, matched MWh, price), as returned by `Market.market_clearing`.
+        """
+        if self.settlement_price is not None:
+            return list(zip(self.supply_ids, self.demand_ids, self.matched_mwh.tolist(), self.settlement_price.tolist()))
+        return [
+            (supply_id, demand_id, mwh, self.clearing_price)
+            for supply_id, demand_id, mwh in zip(self.supply_ids, self.demand_ids, self.matched_mwh.tolist())
+        ]
+
+    @property
+    def cleared_mwh(self) -> float:
+        return float(self.matched_mwh.sum())
+
+    @property
+    def welfare(self) -> Optional[float]:
+        if self.consumer_surplus is None:
+            return None
+        return self.consumer_surplus + self.producer_surplus
+
+    @property
+    def marginal_supply_id(self):
+        """
+        Supply bid of the last match, which sets the uniform price. None without matches.
+        """
+        return self.supply_ids[-1] if len(self.supply_ids) else None
+
+    @property
+    def marginal_demand_id(self):
+        """
+        Demand bid of the last match. None without matches.
+        """
+        return self.demand_ids[-1] if len(self.demand_ids) else None
+
+    @property
+    def crossing_point(self):
+        """
+        (cleared MWh, clearing price) where the supply and demand curves cross.
+        """
+        return self.cleared_mwh, self.clearing_price
+
+
 class Market():
 
-    def market_clearing(supply_bids, demand_bids):
+    def market_clearing(supply_bids, demand_bids, pricing="uniform", verbose=False):
         """
-        Market clearing algorithm with uniform pricing and unique bid identifiers.
+        Market clearing algorithm with unique bid identifiers, settling the matches with the
+        given pricing rule.
         
         Parameters:
         - supply_bids: List of tuples (id, MWh, price) representing supply bids.
         - demand_bids: List of tuples (id, MWh, price) representing demand bids.
+        - pricing: Pricing rule of the matches, one of `PRICING_RULES`.
+        - verbose: If True, print the final clearing price.
         
         Returns:
         - cleared_bids: List of tuples showing matched supply and demand (supply_id, demand_id, matched MWh, price).
-        - clearing_price: The uniform market clearing price.
+        - clearing_price: The uniform market clearing price (the marginal match).
 
         Does not (yet):
         - Return which bids were not cleared.
-        - Return satistics.
+        - Return statistics, see `market_clearing_pure` for a `ClearingResult`.
         
         Possible todos:
         - Bidders might themselves figure out which bids were not cleared when receiving (or not receiving) clearing bids.
         - Unique bid ids?
         """
+        _check_pricing(pricing)
+
         # Step 1: Sort bids by price
         supply_bids.sort(key=lambda x: x[2])  # Sort by price ascending (cheapest first)
         demand_bids.sort(key=lambda x: x[2], reverse=True)  # Sort by price descending (most expensive first)
 
         # Step 2: Matching process
         cleared_bids = []
+        matched_prices = []  # (supply price, demand price) of every match, for discriminatory pricing
         clearing_price: float = None
         i, j = 0, 0  # indices for supply and demand lists
 
@@ -44,6 +192,7 @@ class Market():
             # Record the match (uniform price is the price at which this match happens)
             clearing_price = min(supply_price, demand_price)  # Uniform price determined at the match point
             cleared_bids.append((supply_id, demand_id, match_mwh)) # Price is not added yet, only when final clearing price is found
+            matched_prices.append((supply_price, demand_price))
 
             # Update the remaining supply and demand
             supply_bids[i] = (supply_id, supply_mwh - match_mwh, supply_price)
@@ -55,14 +204,902 @@ class Market():
             if demand_bids[j][1] == 0:
                 j += 1
 
-        # Debug
-        print("FINAL CLEARING PRICE: %s", clearing_price)
+        if verbose:
+            print(f"FINAL CLEARING PRICE: {clearing_price}")
         # Add the clearing price to all cleared bid tuples.
-        cleared_bids = [tuple + (clearing_price,) for tuple in cleared_bids]
+        if pricing == "uniform":
+            cleared_bids = [tuple + (clearing_price,) for tuple in cleared_bids]
+        else:
+            matched_prices = np.array(matched_prices, dtype=np.float64).reshape(-1, 2)
+            settlement_price = Market.settlement_prices(
+                matched_prices[:, 0], matched_prices[:, 1], clearing_price, pricing
+            ).tolist()
+            cleared_bids = [tuple + (price,) for tuple, price in zip(cleared_bids, settlement_price)]
+
+        return cleared_bids, clearing_price
+
+    def settlement_prices(supply_price, demand_price, clearing_price, pricing="uniform"):
+        """
+        Settlement price of every match in one vectorized pass.
+
+        Parameters:
+        - supply_price: Array with the supply bid price of every match.
+        - demand_price: Array with the demand bid price of every match.
+        - clearing_price: The uniform market clearing price.
+        - pricing: Pricing rule, one of `PRICING_RULES`.
+
+        Returns:
+        - settlement_price: Array with the price every match settles at.
+        """
+        supply_price = np.asarray(supply_price, dtype=np.float64)
+        demand_price = np.asarray(demand_price, dtype=np.float64)
+
+        if pricing == "uniform":
+            return np.full(supply_price.shape, np.nan if clearing_price is None else clearing_price)
+        elif pricing == "pay_as_bid":
+            return supply_price.copy()
+        elif pricing == "midpoint":
+            return 0.5 * (supply_price + demand_price)
+        else:
+            raise ValueError(f"Unknown pricing rule: {pricing}")
+
+    def market_clearing_pure(
+        supply_bids, demand_bids, pricing="uniform", log_hook: Callable[[ClearingResult], None] = None):
+        """
+        Side-effect free version of `market_clearing` with the same matching.
+
+        The input lists are neither sorted nor modified, so they can be reused across hours
+        or shared between threads. Outputs are preallocated for the maximum number of matches
+        (every match exhausts at least one bid) and nothing is printed.
+
+        Parameters:
+        - supply_bids: Sequence of tuples (id, MWh, price) representing supply bids.
+        - demand_bids: Sequence of tuples (id, MWh, price) representing demand bids.
+        - pricing: Pricing rule of the matches, one of `PRICING_RULES`.
+        - log_hook: Optional callable receiving the `ClearingResult`, e.g. for logging.
+
+        Returns:
+        - result: ClearingResult with the matches and the uniform clearing price.
+        """
+        _check_pricing(pricing)
+        n_supply, n_demand = len(supply_bids), len(demand_bids)
+
+        # Step 1: Merit order as index lists (stable, as list.sort)
+        supply_order = sorted(range(n_supply), key=lambda k: supply_bids[k][2])
+        demand_order = sorted(range(n_demand), key=lambda k: demand_bids[k][2], reverse=True)
+
+        # Step 2: Preallocate outputs
+        max_matches = max(n_supply + n_demand - 1, 0)
+        supply_ids = [None] * max_matches
+        demand_ids = [None] * max_matches
+        matched_mwh = np.empty(max_matches, dtype=np.float64)
+        matched_prices = np.empty((max_matches, 2), dtype=np.float64)
+        clearing_price: float = None
+        n_matched = 0
+
+        # Step 3: Traverse and match bids along the cumulative curves (as `merit_order`), so
+        # float remainders such as 7.0 - 5.7 - 1.3 never leave a dust match
+        i, j = 0, 0
+        matched_to = 0.0
+        if n_supply and n_demand:
+            supply_id, supply_to, supply_price = supply_bids[supply_order[0]]
+            demand_id, demand_to, demand_price = demand_bids[demand_order[0]]
+
+        while i < n_supply and j < n_demand:
+            # If the demand price is less than the supply price, stop clearing (no match possible)
+            if demand_price < supply_price:
+                break
+
+            # Zero-quantity bids are skipped, they neither match nor set the price
+            match_to = min(supply_to, demand_to)
+            if match_to > matched_to:
+                clearing_price = min(supply_price, demand_price)
+
+                supply_ids[n_matched] = supply_id
+                demand_ids[n_matched] = demand_id
+                matched_mwh[n_matched] = match_to - matched_to
+                matched_prices[n_matched] = supply_price, demand_price
+                n_matched += 1
+                matched_to = match_to
+
+            # Move to the next bid if fully fulfilled
+            if supply_to <= matched_to:
+                i += 1
+                if i < n_supply:
+                    supply_id, supply_mwh, supply_price = supply_bids[supply_order[i]]
+                    supply_to += supply_mwh
+            if demand_to <= matched_to:
+                j += 1
+                if j < n_demand:
+                    demand_id, demand_mwh, demand_price = demand_bids[demand_order[j]]
+                    demand_to += demand_mwh
+
+        settlement_price = None
+        if pricing != "uniform":
+            settlement_price = Market.settlement_prices(
+                matched_prices[:n_matched, 0], matched_prices[:n_matched, 1], clearing_price, pricing
+            )
+
+        result = ClearingResult(
+            supply_ids=supply_ids[:n_matched],
+            demand_ids=demand_ids[:n_matched],
+            matched_mwh=matched_mwh[:n_matched],
+            clearing_price=clearing_price,
+            settlement_price=settlement_price,
+            **_clearing_statistics(
+                matched_mwh[:n_matched], matched_prices[:n_matched, 0], matched_prices[:n_matched, 1],
+                settlement_price, clearing_price,
+                sum(bid[1] for bid in supply_bids), sum(bid[1] for bid in demand_bids),
+            ),
+        )
+
+        if log_hook is not None:
+            log_hook(result)
+
+        return result
+
+    def market_clearing_vectorized(
+        supply_ids, supply_mwh, supply_price, demand_ids, demand_mwh, demand_price, presorted=False, pricing="uniform",
+        ticks=None):
+        """
+        Vectorized merit-order clearing with uniform pricing.
+
+        Same contract as `market_clearing`, but the bids are given as NumPy arrays
+        (one array per field) and the inputs are left untouched. The supply and demand
+        curves are built with cumulative sums and matched segment-wise on the quantity axis.
+
+        With a `TickGrid` the bids are rounded to int64 ticks and lots and cleared with exact
+        integer arithmetic; the results are converted back to prices and MWh.
+
+        Parameters:
+        - supply_ids: Array of supply bid ids.
+        - supply_mwh: Array of supply quantities (MWh).
+        - supply_price: Array of supply prices.
+        - demand_ids: Array of demand bid ids.
+        - demand_mwh: Array of demand quantities (MWh).
+        - demand_price: Array of demand prices.
+        - presorted: True if supply is already sorted by ascending and demand by descending price.
+        - pricing: Pricing rule of the matches, one of `PRICING_RULES`.
+        - ticks: Optional `TickGrid` for fixed-point clearing.
+
+        Returns:
+        - cleared_bids: List of tuples showing matched supply and demand (supply_id, demand_id, matched MWh, price).
+        - clearing_price: The uniform market clearing price, None if the curves do not cross.
+        """
+        if ticks is not None:
+            supply_mwh, demand_mwh = ticks.to_lots(supply_mwh), ticks.to_lots(demand_mwh)
+            supply_price, demand_price = ticks.to_ticks(supply_price), ticks.to_ticks(demand_price)
+
+        supply_idx, demand_idx, matched_mwh, clearing_price = Market.merit_order(
+            supply_mwh, supply_price, demand_mwh, demand_price, presorted=presorted
+        )
+
+        settlement_price = Market.settlement_prices(
+            np.asarray(supply_price, dtype=np.float64)[supply_idx],
+            np.asarray(demand_price, dtype=np.float64)[demand_idx],
+            clearing_price, pricing,
+        )
+
+        if ticks is not None:
+            matched_mwh = ticks.from_lots(matched_mwh)
+            settlement_price = ticks.from_ticks(settlement_price)
+            if clearing_price is not None:
+                clearing_price = float(ticks.from_ticks(clearing_price))
+
+        supply_ids = np.asarray(supply_ids, dtype=object)[supply_idx].tolist()
+        demand_ids = np.asarray(demand_ids, dtype=object)[demand_idx].tolist()
+        cleared_bids = list(zip(supply_ids, demand_ids, matched_mwh.tolist(), settlement_price.tolist()))
+
+        return cleared_bids, clearing_price
+
+    def market_clearing_book(bid_book, out=None, pricing="uniform", presorted=False, log_hook=None):
+        """
+        Clear a `BidBook` with uniform pricing.
+
+        Parameters:
+        - bid_book: BidBook holding both supply (SELL) and demand (BUY) bids.
+        - out: Optional BidBook that is cleared and reused for the result.
+        - pricing: Pricing rule of the matches, one of `PRICING_RULES`.
+        - presorted: True if the book is in merit order (see `BidBook.merit_order`).
+        - log_hook: Optional callable receiving the `ClearingResult` with the statistics
+          of this clearing; its ids are the interned agent indices of the book.
+
+        Returns:
+        - cleared_book: BidBook with two rows per match, the SELL leg followed by the BUY
+          leg, each holding the agent, the matched MWh and the settlement price.
+        - clearing_price: The uniform market clearing price, None if the curves do not cross.
+        """
+        supply = bid_book.select(SELL)
+        demand = bid_book.select(BUY)
+        mwh, price, agent = bid_book.mwh, bid_book.price, bid_book.agent
+
+        supply_idx, demand_idx, matched_mwh, clearing_price = Market.merit_order(
+            mwh[supply], price[supply], mwh[demand], price[demand], presorted=presorted
+        )
+
+        settlement_price = Market.settlement_prices(
+            price[supply[supply_idx]], price[demand[demand_idx]], clearing_price, pricing
+        )
+
+        n_matched = matched_mwh.size
+        cleared_book = (out if out is not None else BidBook(2 * n_matched)).clear()
+        cleared_book.reserve(2 * n_matched)
+
+        legs_agent = np.empty(2 * n_matched, dtype=np.int32)
+        legs_agent[0::2] = agent[supply[supply_idx]]
+        legs_agent[1::2] = agent[demand[demand_idx]]
+        legs_side = np.empty(2 * n_matched, dtype=np.int8)
+        legs_side[0::2] = SELL
+        legs_side[1::2] = BUY
+
+        cleared_book.extend(legs_agent, np.repeat(matched_mwh, 2), np.repeat(settlement_price, 2), legs_side)
+
+        if log_hook is not None:
+            log_hook(_clearing_result(
+                legs_agent[0::2], legs_agent[1::2], matched_mwh,
+                price[supply[supply_idx]], price[demand[demand_idx]], clearing_price, pricing,
+                mwh[supply].sum(), mwh[demand].sum(),
+            ))
+
+        return cleared_book, clearing_price
+
+    def market_allocation(
+        supply_mwh, supply_price, demand_mwh, demand_price, presorted=False, tie_breaking="time", seed=0,
+        supply_key=None, demand_key=None):
+        """
+        Total cleared MWh of every bid instead of the individual matches. Under uniform
+        pricing this is all a participant needs to settle.
+
+        Parameters:
+        - supply_mwh, supply_price: Arrays describing the supply bids.
+        - demand_mwh, demand_price: Arrays describing the demand bids.
+        - presorted: True if the bids are already in merit order, which skips the sort.
+        - tie_breaking: Allocation among bids at the same price, one of `TIE_BREAKING`.
+        - seed: Seed of the "random" tie breaking.
+        - supply_key, demand_key: Optional arrays (e.g. agent indices) ordering the bids of a level
+          in the tie breaking, so that it does not depend on the order of the bids (see `break_ties`).
+
+        Returns:
+        - supply_allocation: Cleared MWh per supply bid.
+        - demand_allocation: Cleared MWh per demand bid.
+        - clearing_price: The uniform market clearing price, None if the curves do not cross.
+        """
+        supply_idx, demand_idx, matched_mwh, clearing_price = Market.merit_order(
+            supply_mwh, supply_price, demand_mwh, demand_price, presorted=presorted
+        )
+        dtype = np.result_type(np.asarray(supply_mwh), np.asarray(demand_mwh), matched_mwh)
+        supply_allocation = np.bincount(supply_idx, weights=matched_mwh, minlength=len(supply_mwh)).astype(dtype)
+        demand_allocation = np.bincount(demand_idx, weights=matched_mwh, minlength=len(demand_mwh)).astype(dtype)
+
+        if tie_breaking != "time":
+            supply_allocation = Market.break_ties(
+                supply_mwh, supply_price, supply_allocation, tie_breaking, seed, key=supply_key
+            )
+            demand_allocation = Market.break_ties(
+                demand_mwh, demand_price, demand_allocation, tie_breaking, seed, key=demand_key
+            )
+
+        return supply_allocation, demand_allocation, clearing_price
+
+    def break_ties(mwh, price, allocation, tie_breaking="pro_rata", seed=0, key=None):
+        """
+        Redistribute the cleared MWh of one side among the bids of every price level.
+
+        The cleared volume of a price level does not depend on the order of its bids, so
+        levels are grouped with one `np.unique` and their volume is shared again: in
+        proportion to the bid sizes ("pro_rata") or in a random order drawn from `seed`
+        ("random"). Only the marginal level can be partially cleared, all other levels are
+        left as they are. Integer lots (see `TickGrid`) are shared with the largest
+        remainder method, so the level totals stay exact; equal remainders go to the
+        smallest `key` (e.g. the agent index). With a `key`, the random order is drawn per
+        key as well, so neither rule depends on the order of the bids.
+
+        Parameters:
+        - mwh, price: Arrays describing the bids of one side.
+        - allocation: Cleared MWh per bid, e.g. from `market_allocation`.
+        - tie_breaking: One of `TIE_BREAKING`.
+        - seed: Seed of the "random" tie breaking.
+        - key: Optional array identifying the bids (e.g. agent indices), by position if None.
+
+        Returns:
+        - allocation: Cleared MWh per bid after tie breaking.
+        """
+        if tie_breaking not in TIE_BREAKING:
+            raise ValueError(f"Unknown tie breaking: {tie_breaking}")
+        allocation = np.asarray(allocation)
+        if tie_breaking == "time" or allocation.size == 0:
+            return allocation
+
+        mwh = _exact_array(mwh)
+        levels, level = np.unique(np.asarray(price), return_inverse=True)
+        level = level.ravel()
+        level_cleared = np.bincount(level, weights=allocation, minlength=levels.size)
+
+        if tie_breaking == "random":
+            # Fill every level in a random order, as `allocate_levels` does in submission order
+            rng = np.random.default_rng(seed)
+            if key is None:
+                priority = rng.permutation(mwh.size)
+            else:
+                keys, key_rank = np.unique(np.asarray(key), return_inverse=True)
+                priority = rng.permutation(keys.size)[key_rank.ravel()]
+            order = np.lexsort((priority, level))
+            cum_before = np.cumsum(mwh[order]) - mwh[order]
+            level_start = cum_before[np.searchsorted(level[order], level[order], side="left")]
+            result = np.empty_like(allocation)
+            result[order] = np.clip(level_cleared[level[order]] - (cum_before - level_start), 0, mwh[order])
+            return result
+
+        level_mwh = np.bincount(level, weights=mwh, minlength=levels.size)
+        if not np.issubdtype(allocation.dtype, np.integer):
+            share = np.divide(level_cleared, level_mwh, out=np.zeros(levels.size), where=level_mwh > 0)
+            return mwh * share[level]
+
+        # Largest remainder: floor of the exact share, leftover lots to the largest remainders
+        level_cleared = level_cleared.astype(np.int64)
+        level_mwh = np.maximum(level_mwh.astype(np.int64), 1)
+        numerator = mwh * level_cleared[level]
+        result, remainder = np.divmod(numerator, level_mwh[level])
+        leftover = level_cleared - np.bincount(level, weights=result, minlength=levels.size).astype(np.int64)
+        key = np.arange(mwh.size) if key is None else np.asarray(key)
+        order = np.lexsort((key, -remainder, level))
+        rank = np.arange(mwh.size) - np.searchsorted(level[order], level[order], side="left")
+        result[order] += rank < leftover[level[order]]
+        return result
+
+    def market_allocation_book(bid_book, presorted=False, log_hook=None, tie_breaking="time", seed=0):
+        """
+        Cleared MWh of every bid of a `BidBook` with uniform pricing.
+
+        Parameters:
+        - bid_book: BidBook holding both supply (SELL) and demand (BUY) bids.
+        - presorted: True if the book is in merit order (see `BidBook.merit_order`).
+        - log_hook: Optional callable receiving the `ClearingResult`, as in `market_clearing_book`.
+        - tie_breaking: Allocation among bids at the same price, one of `TIE_BREAKING`.
+        - seed: Seed of the "random" tie breaking.
+
+        Returns:
+        - allocation: Cleared MWh per row of the book.
+        - clearing_price: The uniform market clearing price, None if the curves do not cross.
+        """
+        supply = bid_book.select(SELL)
+        demand = bid_book.select(BUY)
+        mwh, price = bid_book.mwh, bid_book.price
+
+        supply_idx, demand_idx, matched_mwh, clearing_price = Market.merit_order(
+            mwh[supply], price[supply], mwh[demand], price[demand], presorted=presorted
+        )
+
+        # Matches of a bid are summed into its row of the book
+        allocation = np.bincount(
+            np.concatenate((supply[supply_idx], demand[demand_idx])),
+            weights=np.concatenate((matched_mwh, matched_mwh)),
+            minlength=len(bid_book),
+        ).astype(np.result_type(mwh, matched_mwh))
+
+        if tie_breaking != "time":
+            for rows in (supply, demand):
+                allocation[rows] = Market.break_ties(
+                    mwh[rows], price[rows], allocation[rows], tie_breaking, seed, key=bid_book.agent[rows]
+                )
+
+        if log_hook is not None:
+            log_hook(_clearing_result(
+                bid_book.agent[supply[supply_idx]], bid_book.agent[demand[demand_idx]], matched_mwh,
+                price[supply[supply_idx]], price[demand[demand_idx]], clearing_price, "uniform",
+                mwh[supply].sum(), mwh[demand].sum(),
+            ))
+
+        return allocation, clearing_price
+
+    def merit_order(supply_mwh, supply_price, demand_mwh, demand_price, presorted=False):
+        """
+        Core of the vectorized clearing. Finds the crossing of the cumulative supply
+        and demand curves and the matched segments between them.
+
+        Matches are the same as the ones produced by the loop in `market_clearing`:
+        bids are sorted stably (cheapest supply and most expensive demand first) and every
+        segment of the quantity axis where a supply and a demand step overlap is one match.
+        Zero-quantity bids never produce a match. Integer inputs (see `TickGrid`) are kept
+        as int64, so curves, remainders and price comparisons are exact.
+
+        Parameters:
+        - supply_mwh, supply_price: Arrays describing the supply bids.
+        - demand_mwh, demand_price: Arrays describing the demand bids.
+        - presorted: True if the bids are already in merit order, which skips the sort.
+
+        Returns:
+        - supply_idx: Index into the supply arrays for every match.
+        - demand_idx: Index into the demand arrays for every match.
+        - matched_mwh: Matched quantity for every match.
+        - clearing_price: The uniform market clearing price, None if the curves do not cross.
+        """
+        supply_mwh = _exact_array(supply_mwh)
+        supply_price = _exact_array(supply_price)
+        demand_mwh = _exact_array(demand_mwh)
+        demand_price = _exact_array(demand_price)
+
+        no_match = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0), None)
+        if supply_mwh.size == 0 or demand_mwh.size == 0:
+            return no_match
+
+        # Step 1: Sort bids by price (stable, so ties keep submission order as with list.sort)
+        if presorted:
+            sorted_supply_price, sorted_supply_mwh = supply_price, supply_mwh
+            sorted_demand_price, sorted_demand_mwh = demand_price, demand_mwh
+        else:
+            supply_order = np.argsort(supply_price, kind="stable")
+            demand_order = np.argsort(-demand_price, kind="stable")
+            sorted_supply_price, sorted_supply_mwh = supply_price[supply_order], supply_mwh[supply_order]
+            sorted_demand_price, sorted_demand_mwh = demand_price[demand_order], demand_mwh[demand_order]
+
+        # Step 2: Build the cumulative curves and split the quantity axis into segments
+        supply_cum = np.cumsum(sorted_supply_mwh)
+        demand_cum = np.cumsum(sorted_demand_mwh)
+        total_mwh = min(supply_cum[-1], demand_cum[-1])
+        if total_mwh <= 0:
+            return no_match
+
+        # Both curves are sorted, so a stable merge of the two runs gives the breakpoints
+        # below the total in linear time, and counting the breakpoints of each curve gives
+        # the bid active on each side after every breakpoint (the last of equal ones counts)
+        merged = np.concatenate((supply_cum, demand_cum))
+        merged_order = np.argsort(merged, kind="stable")
+        breakpoints = merged[merged_order]
+        n_below = np.searchsorted(breakpoints, total_mwh, side="left")
+        breakpoints = breakpoints[:n_below]
+        n_supply_passed = np.cumsum(merged_order[:n_below] < supply_cum.size)
+        n_demand_passed = np.arange(1, n_below + 1) - n_supply_passed
+        last = np.flatnonzero(breakpoints[1:] != breakpoints[:-1])
+        last = np.append(last, n_below - 1) if n_below else last
+        breakpoints = breakpoints[last]
+
+        # Segments start at 0 and at every breakpoint, zero-quantity bids at the front of a
+        # curve put a breakpoint at 0 already
+        if breakpoints.size and breakpoints[0] == 0:
+            starts, i, j = breakpoints, n_supply_passed[last], n_demand_passed[last]
+        else:
+            starts = np.concatenate((np.zeros(1, dtype=breakpoints.dtype), breakpoints))
+            i = np.concatenate(([0], n_supply_passed[last]))
+            j = np.concatenate(([0], n_demand_passed[last]))
+
+        # Step 3: The price gap is non-increasing along the curves, so the crossing is
+        # the first segment where the demand price drops below the supply price.
+        gap = sorted_demand_price[j] - sorted_supply_price[i]
+        n_matched = np.searchsorted(-gap, 0.0, side="right")
+        if n_matched == 0:
+            return no_match
+
+        # Every matched segment ends at the next start, the last one possibly at the total
+        i, j = i[:n_matched], j[:n_matched]
+        edges = starts[:n_matched + 1]
+        if edges.size == n_matched:
+            edges = np.append(edges, total_mwh)
+        matched_mwh = np.diff(edges)
+
+        # Uniform price is the supply price of the last match, as in the loop
+        clearing_price = sorted_supply_price[i[-1]].item()
+
+        if presorted:
+            return i, j, matched_mwh, clearing_price
+        return supply_order[i], demand_order[j], matched_mwh, clearing_price
+
+    def marginal_prices(
+        n_areas, supply_area, supply_mwh, supply_price, supply_cleared,
+        demand_area, demand_mwh, demand_price, demand_cleared, tol=1e-9):
+        """
+        Prices of an optimization-based clearing (LP duals can be anywhere in a degenerate
+        price interval) in the convention of `merit_order`: the highest price of a cleared
+        supply bid in every price area. A supply bid left open at or below the price of an
+        open demand bid trades with zero surplus, which the merit order clears but an LP may
+        not, so its price is the marginal one then.
+
+        Parameters:
+        - n_areas: Number of price areas.
+        - supply_area, supply_mwh, supply_price, supply_cleared: Area, quantity, price and cleared MWh of every supply bid.
+        - demand_area, demand_mwh, demand_price, demand_cleared: Area, quantity, price and cleared MWh of every demand bid.
+        - tol: MWh below which a bid counts as uncleared (or fully cleared).
+
+        Returns:
+        - prices: Price of every area, NaN if the area clears no supply.
+        """
+        supply_area = np.asarray(supply_area, dtype=np.intp)
+        supply_price = np.asarray(supply_price, dtype=np.float64)
+        supply_cleared = np.asarray(supply_cleared, dtype=np.float64)
+        demand_area = np.asarray(demand_area, dtype=np.intp)
+        demand_price = np.asarray(demand_price, dtype=np.float64)
+
+        # Step 1: Highest cleared supply price of every area
+        marginal = np.full(n_areas, -np.inf)
+        cleared = supply_cleared > tol
+        np.maximum.at(marginal, supply_area[cleared], supply_price[cleared])
+
+        # Step 2: Cheapest open supply and most expensive open demand of every area
+        open_supply = np.full(n_areas, np.inf)
+        remaining = supply_cleared < np.asarray(supply_mwh, dtype=np.float64) - tol
+        np.minimum.at(open_supply, supply_area[remaining], supply_price[remaining])
+        open_demand = np.full(n_areas, -np.inf)
+        remaining = np.asarray(demand_cleared, dtype=np.float64) < np.asarray(demand_mwh, dtype=np.float64) - tol
+        np.maximum.at(open_demand, demand_area[remaining], demand_price[remaining])
+
+        # Step 3: Zero-surplus trades left open by the LP set the price
+        has_supply = marginal > -np.inf
+        zero_surplus = has_supply & (open_demand >= open_supply - tol)
+        marginal[zero_surplus] = np.maximum(marginal[zero_surplus], open_supply[zero_surplus])
+        return np.where(has_supply, marginal, np.nan)
+
+    def market_clearing_batch(supply_mwh, supply_price, demand_mwh, demand_price):
+        """
+        Clear many independent auctions (e.g. the 24 hours of a day-ahead auction or
+        Monte-Carlo scenarios) in one vectorized call with uniform pricing.
+
+        Every row of the input arrays is one auction. Rows with fewer bids can be padded
+        with zero-quantity bids, which are never cleared.
+
+        Parameters:
+        - supply_mwh: Array (rows x supply bids) of supply quantities (MWh).
+        - supply_price: Array (rows x supply bids) of supply prices.
+        - demand_mwh: Array (rows x demand bids) of demand quantities (MWh).
+        - demand_price: Array (rows x demand bids) of demand prices.
+
+        Returns:
+        - clearing_prices: Array (rows,) of uniform clearing prices, NaN where the curves do not cross.
+        - supply_allocation: Array (rows x supply bids) of cleared MWh per supply bid.
+        - demand_allocation: Array (rows x demand bids) of cleared MWh per demand bid.
+        """
+        supply_mwh = np.atleast_2d(np.asarray(supply_mwh, dtype=np.float64))
+        supply_price = np.atleast_2d(np.asarray(supply_price, dtype=np.float64))
+        demand_mwh = np.atleast_2d(np.asarray(demand_mwh, dtype=np.float64))
+        demand_price = np.atleast_2d(np.asarray(demand_price, dtype=np.float64))
+
+        n_rows = supply_mwh.shape[0]
+        clearing_prices = np.full(n_rows, np.nan)
+        supply_allocation = np.zeros_like(supply_mwh)
+        demand_allocation = np.zeros_like(demand_mwh)
+        if supply_mwh.shape[1] == 0 or demand_mwh.shape[1] == 0:
+            return clearing_prices, supply_allocation, demand_allocation
+
+        # Step 1: Sort bids by price within every row
+        supply_order = np.argsort(supply_price, axis=1, kind="stable")
+        demand_order = np.argsort(-demand_price, axis=1, kind="stable")
+        sorted_supply_price = np.take_along_axis(supply_price, supply_order, axis=1)
+        sorted_demand_price = np.take_along_axis(demand_price, demand_order, axis=1)
+        sorted_supply_mwh = np.take_along_axis(supply_mwh, supply_order, axis=1)
+        sorted_demand_mwh = np.take_along_axis(demand_mwh, demand_order, axis=1)
+
+        # Step 2: Cumulative curves and where every step starts on the quantity axis
+        supply_cum = np.cumsum(sorted_supply_mwh, axis=1)
+        demand_cum = np.cumsum(sorted_demand_mwh, axis=1)
+        supply_start = supply_cum - sorted_supply_mwh
+        demand_start = demand_cum - sorted_demand_mwh
+        total_mwh = np.minimum(supply_cum[:, -1], demand_cum[:, -1])
+
+        # Step 3: A step is accepted if it starts before the end of the shorter curve and
+        # the opposite curve is still in the money at its start. Acceptance is monotone
+        # along each curve, so counting accepted steps gives the last accepted one.
+        n_supply, n_demand = supply_mwh.shape[1], demand_mwh.shape[1]
+        demand_at_supply = np.minimum(_searchsorted_rows(demand_cum, supply_start), n_demand - 1)
+        supply_at_demand = np.minimum(_searchsorted_rows(supply_cum, demand_start), n_supply - 1)
+
+        supply_accepted = (supply_start < total_mwh[:, None]) & (
+            np.take_along_axis(sorted_demand_price, demand_at_supply, axis=1) >= sorted_supply_price
+        )
+        demand_accepted = (demand_start < total_mwh[:, None]) & (
+            np.take_along_axis(sorted_supply_price, supply_at_demand, axis=1) <= sorted_demand_price
+        )
+        n_supply_accepted = supply_accepted.sum(axis=1)
+        n_demand_accepted = demand_accepted.sum(axis=1)
+
+        rows = np.arange(n_rows)
+        crossed = (n_supply_accepted > 0) & (n_demand_accepted > 0)
+        cleared_mwh = np.where(
+            crossed,
+            np.minimum(
+                supply_cum[rows, np.maximum(n_supply_accepted - 1, 0)],
+                demand_cum[rows, np.maximum(n_demand_accepted - 1, 0)],
+            ),
+            0.0,
+        )
+        cleared_mwh = np.minimum(cleared_mwh, total_mwh)
+
+        # Step 4: Uniform price is the price of the supply step the cleared volume ends in
+        marginal_supply = np.minimum((supply_cum < cleared_mwh[:, None]).sum(axis=1), n_supply - 1)
+        crossed &= cleared_mwh > 0
+        clearing_prices[crossed] = sorted_supply_price[rows, marginal_supply][crossed]
+
+        # Step 5: Allocate the cleared volume along the merit order and restore the input order
+        np.put_along_axis(
+            supply_allocation, supply_order,
+            np.clip(cleared_mwh[:, None] - supply_start, 0.0, sorted_supply_mwh), axis=1,
+        )
+        np.put_along_axis(
+            demand_allocation, demand_order,
+            np.clip(cleared_mwh[:, None] - demand_start, 0.0, sorted_demand_mwh), axis=1,
+        )
+
+        return clearing_prices, supply_allocation, demand_allocation
+
+    def curve_segments(mwh, price, interpolation="step", descending=False):
+        """
+        Split a bid curve into segments with a price range.
+
+        A curve is given by breakpoints: cumulative MWh and the price at each breakpoint.
+        - step: the quantity between two breakpoints is bid at the price of the upper breakpoint.
+        - linear: the price moves linearly between two breakpoints. The quantity up to the
+          first breakpoint is bid at the first price.
+
+        Parameters:
+        - mwh: Cumulative MWh at every breakpoint (non-decreasing).
+        - price: Price at every breakpoint, non-decreasing for supply and non-increasing for demand.
+        - interpolation: "step" or "linear".
+        - descending: True for demand curves.
+
+        Returns:
+        - segment_mwh: Quantity of every segment.
+        - segment_low: Lowest price of every segment.
+        - segment_high: Highest price of every segment (equal to the lowest for steps).
+        """
+        mwh = np.asarray(mwh, dtype=np.float64).ravel()
+        price = np.asarray(price, dtype=np.float64).ravel()
+        if mwh.shape != price.shape or mwh.size == 0:
+            raise ValueError("A bid curve needs the same, non-zero number of MWh and price breakpoints")
+        if interpolation not in ("step", "linear"):
+            raise ValueError(f"Unknown curve interpolation: {interpolation}")
+
+        segment_mwh = np.diff(mwh, prepend=0.0)
+        price_change = np.diff(price)
+        if np.any(segment_mwh < 0):
+            raise ValueError("Bid curve MWh breakpoints must be non-decreasing")
+        if np.any(price_change > 0 if descending else price_change < 0):
+            raise ValueError(
+                "Demand curve prices must be non-increasing" if descending
+                else "Supply curve prices must be non-decreasing"
+            )
+
+        # Price at the start of every segment
+        start_price = price if interpolation == "step" else np.concatenate((price[:1], price[:-1]))
+        return segment_mwh, np.minimum(start_price, price), np.maximum(start_price, price)
+
+    def market_clearing_curves(supply_curves, demand_curves):
+        """
+        Uniform price clearing of step and piecewise-linear bid curves.
+
+        The curves of all bidders are aggregated in price space and the traded volume is
+        the largest volume both aggregated curves can support. The clearing price is the
+        supply price of the marginal MWh, as in `market_clearing`; bidders at the marginal
+        price level are filled in merit order. For step curves the matches are the same as
+        clearing every step as a separate bid.
+
+        Parameters:
+        - supply_curves: Sequence of tuples (id, MWh breakpoints, price breakpoints, interpolation).
+        - demand_curves: Sequence of tuples (id, MWh breakpoints, price breakpoints, interpolation).
+
+        Returns:
+        - cleared_bids: List of tuples showing matched supply and demand (supply_id, demand_id, matched MWh, price).
+        - clearing_price: The uniform market clearing price, None if the curves do not cross.
+        """
+        supply_owner, supply_mwh, supply_low, supply_high = _flatten_curves(supply_curves, descending=False)
+        demand_owner, demand_mwh, demand_low, demand_high = _flatten_curves(demand_curves, descending=True)
+        if supply_mwh.size == 0 or demand_mwh.size == 0:
+            return [], None
+
+        # Step 1: Aggregated curves on the grid of all breakpoint prices. Demand is handled
+        # as a supply curve over negated prices, so D(p) is evaluated on the reversed grid.
+        grid = np.unique(np.concatenate((supply_low, supply_high, demand_low, demand_high)))
+        supply_at, supply_below = _aggregate_curve(grid, supply_mwh, supply_low, supply_high)
+        demand_at, demand_above = _aggregate_curve(-grid[::-1], demand_mwh, -demand_high, -demand_low)
+        demand_at, demand_above = demand_at[::-1], demand_above[::-1]
+
+        # Step 2: The traded volume is the maximum of min(S(p), D(p)), reached either on a
+        # breakpoint or where the curves cross inside a linear section.
+        traded = np.minimum(supply_at, demand_at)
+        gap_start = demand_above[:-1] - supply_at[:-1]
+        gap_end = demand_at[1:] - supply_below[1:]
+        crossing = (gap_start > 0) & (gap_end < 0)
+        if np.any(crossing):
+            t = gap_start[crossing] / (gap_start[crossing] - gap_end[crossing])
+            crossed = supply_at[:-1][crossing] + t * (supply_below[1:][crossing] - supply_at[:-1][crossing])
+            traded = np.concatenate((traded, crossed))
+        cleared_mwh = float(traded.max())
+        if cleared_mwh <= 0:
+            return [], None
+
+        # Step 3: Price levels where each curve reaches the traded volume
+        clearing_price = _curve_level(grid, supply_at, supply_below, cleared_mwh)
+        demand_level = -_curve_level(-grid[::-1], demand_at[::-1], demand_above[::-1], cleared_mwh)
+
+        # Step 4: Allocate every segment and pair them up along the merit order
+        supply_allocation = _allocate_segments(supply_mwh, supply_low, supply_high, clearing_price, cleared_mwh)
+        demand_allocation = _allocate_segments(demand_mwh, -demand_high, -demand_low, -demand_level, cleared_mwh)
+
+        supply_order = np.argsort(supply_low, kind="stable")
+        demand_order = np.argsort(-demand_high, kind="stable")
+        i, j, matched_mwh = _pair_volumes(supply_allocation[supply_order], demand_allocation[demand_order])
+
+        supply_ids = [curve[0] for curve in supply_curves]
+        demand_ids = [curve[0] for curve in demand_curves]
+        cleared_bids = [
+            (supply_ids[s], demand_ids[d], mwh, clearing_price)
+            for s, d, mwh in zip(
+                supply_owner[supply_order[i]].tolist(), demand_owner[demand_order[j]].tolist(), matched_mwh.tolist()
+            )
+        ]
 
         return cleared_bids, clearing_price
 
 
+def _flatten_curves(curves, descending):
+    """
+    Segments of all curves as arrays (owner, mwh, low price, high price).
+    """
+    owners, mwh, low, high = [], [], [], []
+    for k, (_, curve_mwh, curve_price, interpolation) in enumerate(curves):
+        segment_mwh, segment_low, segment_high = Market.curve_segments(
+            curve_mwh, curve_price, interpolation, descending=descending
+        )
+        owners.append(np.full(segment_mwh.size, k, dtype=np.intp))
+        mwh.append(segment_mwh)
+        low.append(segment_low)
+        high.append(segment_high)
+
+    if not owners:
+        return np.empty(0, dtype=np.intp), np.empty(0), np.empty(0), np.empty(0)
+    return np.concatenate(owners), np.concatenate(mwh), np.concatenate(low), np.concatenate(high)
+
+
+def _aggregate_curve(grid, mwh, low, high):
+    """
+    Aggregated quantity bid at a price of at most p, for every p in the sorted grid.
+
+    Returns:
+    - at: Quantity at prices <= p (steps at p included).
+    - below: Quantity at prices < p (left limit).
+    """
+    ramp = high > low
+    low_idx = np.searchsorted(grid, low)
+    high_idx = np.searchsorted(grid, high)
+
+    # Linear segments: piecewise constant slope between grid points
+    slope_change = np.zeros(grid.size)
+    slope = mwh[ramp] / (high[ramp] - low[ramp])
+    np.add.at(slope_change, low_idx[ramp], slope)
+    np.add.at(slope_change, high_idx[ramp], -slope)
+    ramp_at = np.concatenate(([0.0], np.cumsum(np.cumsum(slope_change)[:-1] * np.diff(grid))))
+
+    # Steps: jumps at their price
+    jump = np.zeros(grid.size)
+    np.add.at(jump, low_idx[~ramp], mwh[~ramp])
+    step_at = np.cumsum(jump)
+
+    return ramp_at + step_at, ramp_at + step_at - jump
+
+
+def _curve_level(grid, at, below, quantity):
+    """
+    Lowest price at which an aggregated curve (see `_aggregate_curve`) reaches the quantity.
+    """
+    tolerance = 1e-9 * max(1.0, quantity)
+    k = int(np.argmax(at >= quantity - tolerance))
+    if k > 0 and below[k] >= quantity - tolerance and below[k] > at[k - 1]:
+        # Reached inside the linear section before grid[k]
+        share = (quantity - at[k - 1]) / (below[k] - at[k - 1])
+        return float(grid[k - 1] + min(max(share, 0.0), 1.0) * (grid[k] - grid[k - 1]))
+    return float(grid[k])
+
+
+def _allocate_segments(mwh, low, high, level, quantity):
+    """
+    Quantity of every segment cleared when a curve is filled up to `quantity` at price `level`.
+    Steps at exactly the level share the remainder in merit order.
+    """
+    ramp = high > low
+    allocation = np.where(
+        ramp, mwh * np.clip((level - low) / np.where(ramp, high - low, 1.0), 0.0, 1.0), 0.0
+    )
+    allocation[~ramp & (low < level)] = mwh[~ramp & (low < level)]
+
+    marginal = np.flatnonzero(~ramp & (low == level))
+    remainder = min(max(quantity - allocation.sum(), 0.0), mwh[marginal].sum())
+    filled_before = np.cumsum(mwh[marginal]) - mwh[marginal]
+    allocation[marginal] = np.clip(remainder - filled_before, 0.0, mwh[marginal])
+
+    return allocation
+
+
+def _pair_volumes(supply_mwh, demand_mwh):
+    """
+    Pair two sequences of volumes along the quantity axis.
+
+    Returns:
+    - i, j: Position in supply and demand of every pair.
+    - mwh: Volume of every pair.
+    """
+    supply_cum = np.cumsum(supply_mwh)
+    demand_cum = np.cumsum(demand_mwh)
+    total_mwh = min(supply_cum[-1], demand_cum[-1])
+
+    breakpoints = np.union1d(supply_cum, demand_cum)
+    breakpoints = breakpoints[breakpoints < total_mwh]
+    starts = np.concatenate(([0.0], breakpoints))
+    ends = np.concatenate((breakpoints, [total_mwh]))
+    keep = ends > starts
+
+    i = np.searchsorted(supply_cum, starts[keep], side="right")
+    j = np.searchsorted(demand_cum, starts[keep], side="right")
+    return i, j, (ends - starts)[keep]
+
+
+def _clearing_result(
+    supply_ids, demand_ids, matched_mwh, supply_price, demand_price, clearing_price, pricing,
+    total_supply_mwh, total_demand_mwh):
+    """
+    `ClearingResult` with statistics from the matches and the bid prices of every match.
+    """
+    settlement_price = None
+    if pricing != "uniform":
+        settlement_price = Market.settlement_prices(supply_price, demand_price, clearing_price, pricing)
+
+    return ClearingResult(
+        supply_ids=supply_ids,
+        demand_ids=demand_ids,
+        matched_mwh=matched_mwh,
+        clearing_price=clearing_price,
+        settlement_price=settlement_price,
+        **_clearing_statistics(
+            matched_mwh, supply_price, demand_price, settlement_price, clearing_price,
+            total_supply_mwh, total_demand_mwh,
+        ),
+    )
+
+
+def _clearing_statistics(
+    matched_mwh, supply_price, demand_price, settlement_price, clearing_price, total_supply_mwh, total_demand_mwh):
+    """
+    Surplus and unmatched volume from the matches, with their supply and demand bid prices.
+    """
+    matched_mwh = np.asarray(matched_mwh, dtype=np.float64)
+    if settlement_price is None:
+        settlement_price = np.nan if clearing_price is None else clearing_price
+    cleared_mwh = matched_mwh.sum()
+
+    return dict(
+        consumer_surplus=float(matched_mwh @ (np.asarray(demand_price, dtype=np.float64) - settlement_price)),
+        producer_surplus=float(matched_mwh @ (settlement_price - np.asarray(supply_price, dtype=np.float64))),
+        unmatched_supply_mwh=float(total_supply_mwh - cleared_mwh),
+        unmatched_demand_mwh=float(total_demand_mwh - cleared_mwh),
+    )
+
+
+def _exact_array(values):
+    """
+    Integer arrays as int64 (fixed-point ticks and lots), anything else as float64.
+    """
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.integer):
+        return values.astype(np.int64, copy=False)
+    return values.astype(np.float64, copy=False)
+
+
+def _check_pricing(pricing):
+    if pricing not in PRICING_RULES:
+        raise ValueError(f"Unknown pricing rule: {pricing}")
+
+
+def _searchsorted_rows(a, v):
+    """
+    Row-wise `np.searchsorted(a[r], v[r], side="right")` for 2-D arrays `a` and `v`,
+    both sorted along axis 1.
+    """
+    n_rows, n_a = a.shape
+    merged = np.concatenate((a, v), axis=1)
+    # Stable sort puts elements of `a` before equal elements of `v` (side="right")
+    order = np.argsort(merged, axis=1, kind="stable")
+    position = np.empty_like(order)
+    np.put_along_axis(position, order, np.broadcast_to(np.arange(merged.shape[1]), merged.shape), axis=1)
+    # Position of each value minus the values of `v` before it is the number of `a` elements before it
+    return position[:, n_a:] - np.arange(v.shape[1])
+
+
 # Example Usage (id, MWh, price)
 # As example in Pierre Pinson lectures
 
@@ -0,0 +1,318 @@
+import time
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+
+from market_clearing import Market
+
+
+@dataclass(frozen=True)
+class AggregatedCurves:
+    """
+    Supply and demand curves of one zone with all bids at the same price merged into one
+    level. Coupling works on these levels, not on the raw bids.
+
+    Attributes:
+    -----------
+    supply_price (np.ndarray):  supply price levels, ascending
+    supply_mwh (np.ndarray):    MWh offered at every supply level
+    demand_price (np.ndarray):  demand price levels, descending
+    demand_mwh (np.ndarray):    MWh bid at every demand level
+    """
+
+    supply_price: np.ndarray
+    supply_mwh: np.ndarray
+    demand_price: np.ndarray
+    demand_mwh: np.ndarray
+
+    @classmethod
+    def from_bids(cls, supply_mwh, supply_price, demand_mwh, demand_price):
+        supply_price, supply_mwh = _aggregate_levels(supply_mwh, supply_price)
+        demand_price, demand_mwh = _aggregate_levels(demand_mwh, demand_price)
+        return cls(supply_price, supply_mwh, demand_price[::-1], demand_mwh[::-1])
+
+    def price_band(self, max_import: float, max_export: float):
+        """
+        Levels that can be marginal when the zone imports at most `max_import` and exports
+        at most `max_export`.
+
+        The zone price p must allow a net export in [-max_import, max_export]:
+        S(< p) - D(>= p) <= max_export and S(<= p) - D(> p) >= -max_import. Levels outside
+        that price band are fully cleared or not cleared at all in every optimal solution.
+        One extra level is kept on each side so the zone price stays bounded by them.
+
+        Returns:
+        - supply_slice: Slice of the supply levels inside the band.
+        - demand_slice: Slice of the (descending) demand levels inside the band.
+        """
+        demand_price = self.demand_price[::-1]
+        demand_mwh = self.demand_mwh[::-1]
+        grid = np.union1d(self.supply_price, demand_price)
+
+        supply_cum = np.concatenate(([0.0], np.cumsum(self.supply_mwh)))
+        demand_tail = np.concatenate((np.cumsum(demand_mwh[::-1])[::-1], [0.0]))
+        supply_below = supply_cum[np.searchsorted(self.supply_price, grid, side="left")]
+        supply_at = supply_cum[np.searchsorted(self.supply_price, grid, side="right")]
+        demand_at = demand_tail[np.searchsorted(demand_price, grid, side="left")]
+        demand_above = demand_tail[np.searchsorted(demand_price, grid, side="right")]
+
+        low = grid[np.searchsorted(supply_at - demand_above, -max_import, side="left").clip(max=grid.size - 1)]
+        high = grid[(np.searchsorted(supply_below - demand_at, max_export, side="right") - 1).clip(min=0)]
+
+        supply_slice = slice(
+            max(np.searchsorted(self.supply_price, low, side="left") - 1, 0),
+            np.searchsorted(self.supply_price, high, side="right") + 1,
+        )
+        n_demand = demand_price.size
+        demand_slice = slice(
+            max(n_demand - np.searchsorted(demand_price, high, side="right") - 1, 0),
+            n_demand - np.searchsorted(demand_price, low, side="left") + 1,
+        )
+        return supply_slice, demand_slice
+
+
+@dataclass(frozen=True)
+class Interconnector:
+    """
+    Line between two zones with available transfer capacities (ATC) in both directions.
+
+    Attributes:
+    -----------
+    from_zone (int):        index of the exporting zone for positive flows
+    to_zone (int):          index of the importing zone for positive flows
+    atc_forward (float):    maximum flow from `from_zone` to `to_zone`
+    atc_backward (float):   maximum flow from `to_zone` to `from_zone`
+    """
+
+    from_zone: int
+    to_zone: int
+    atc_forward: float
+    atc_backward: float
+
+
+@dataclass(frozen=True)
+class CouplingResult:
+    """
+    Result of a coupled clearing.
+
+    Attributes:
+    -----------
+    zone_prices (np.ndarray):   price per zone, equal across uncongested interconnectors
+    net_export (np.ndarray):    cleared supply minus cleared demand per zone
+    flows (np.ndarray):         flow on every interconnector, positive from `from_zone` to `to_zone`
+    supply_cleared (list):      cleared MWh per supply level, one array per zone
+    demand_cleared (list):      cleared MWh per demand level, one array per zone
+    welfare (float):            total surplus of all zones
+    solver_time (float):        seconds spent in the solver for this clear
+    """
+
+    zone_prices: np.ndarray
+    net_export: np.ndarray
+    flows: np.ndarray
+    supply_cleared: list
+    demand_cleared: list
+    welfare: float
+    solver_time: float
+
+
+class MarketCoupling():
+    """
+    Joint clearing of several zones connected by interconnectors with ATC limits
+    (transport model). Welfare is maximized over the aggregated curve levels of every
+    zone as an LP with HiGHS and zone prices are the duals of the zone balances.
+
+    A zone can export or import no more than the ATC of its interconnectors, which bounds
+    its price to a band of its curves (see `AggregatedCurves.price_band`). Only the levels
+    inside these bands enter the LP, the others are fixed.
+
+    The duals of the zone balances can be anywhere in a degenerate price interval, so zone
+    prices follow the convention of `Market.merit_order` instead: the supply price of the
+    marginal cleared level, taken over every price area (zones joined by uncongested
+    interconnectors).
+
+    Attributes:
+    -----------
+    n_zones (int):              number of zones
+    interconnectors (list):     list of `Interconnector`
+    """
+
+    def __init__(self, n_zones: int, interconnectors: Sequence[Interconnector]):
+        self.n_zones = n_zones
+        self.interconnectors = list(interconnectors)
+
+        # Flow part of the zone balances and flow bounds never change between clears
+        n_lines = len(self.interconnectors)
+        lines = np.arange(n_lines)
+        from_zone = np.array([line.from_zone for line in self.interconnectors], dtype=np.intp)
+        to_zone = np.array([line.to_zone for line in self.interconnectors], dtype=np.intp)
+        self._flow_balance = sparse.csr_array(
+            (
+                np.concatenate((-np.ones(n_lines), np.ones(n_lines))),
+                (np.concatenate((from_zone, to_zone)), np.concatenate((lines, lines))),
+            ),
+            shape=(n_zones, n_lines),
+        )
+        self._flow_bounds = np.array(
+            [(-line.atc_backward, line.atc_forward) for line in self.interconnectors], dtype=np.float64
+        ).reshape(n_lines, 2)
+
+        # Maximum net import and export of every zone
+        self._max_import = np.zeros(n_zones)
+        self._max_export = np.zeros(n_zones)
+        np.add.at(self._max_export, from_zone, self._flow_bounds[:, 1])
+        np.add.at(self._max_import, to_zone, self._flow_bounds[:, 1])
+        np.add.at(self._max_export, to_zone, -self._flow_bounds[:, 0])
+        np.add.at(self._max_import, from_zone, -self._flow_bounds[:, 0])
+
+    def clear(self, zone_curves: Sequence[AggregatedCurves]):
+        """
+        Clear all zones jointly.
+
+        Parameters:
+        - zone_curves: AggregatedCurves of every zone.
+
+        Returns:
+        - result: CouplingResult
+        """
+        start = time.perf_counter()
+        if len(zone_curves) != self.n_zones:
+            raise ValueError(f"Expected curves for {self.n_zones} zones, got {len(zone_curves)}")
+
+        # Step 1: Fix the levels outside the price band of every zone
+        supply_cleared, demand_cleared, supply_free, demand_free = [], [], [], []
+        fixed_export = np.zeros(self.n_zones)
+        fixed_welfare = 0.0
+        for z, curves in enumerate(zone_curves):
+            supply_slice, demand_slice = curves.price_band(self._max_import[z], self._max_export[z])
+            supply = np.where(np.arange(curves.supply_price.size) < supply_slice.start, curves.supply_mwh, 0.0)
+            demand = np.where(np.arange(curves.demand_price.size) < demand_slice.start, curves.demand_mwh, 0.0)
+            fixed_export[z] = supply.sum() - demand.sum()
+            fixed_welfare += curves.demand_price @ demand - curves.supply_price @ supply
+            supply_cleared.append(supply)
+            demand_cleared.append(demand)
+            supply_free.append(supply_slice)
+            demand_free.append(demand_slice)
+
+        free_supply_price = [curves.supply_price[s] for curves, s in zip(zone_curves, supply_free)]
+        free_demand_price = [curves.demand_price[s] for curves, s in zip(zone_curves, demand_free)]
+        n_supply = np.array([price.size for price in free_supply_price])
+        n_demand = np.array([price.size for price in free_demand_price])
+        supply_zone = np.repeat(np.arange(self.n_zones), n_supply)
+        demand_zone = np.repeat(np.arange(self.n_zones), n_demand)
+        n_levels = n_supply.sum() + n_demand.sum()
+
+        # Step 2: Variables: free supply levels, free demand levels, interconnector flows
+        cost = np.concatenate(free_supply_price + [-price for price in free_demand_price] + [np.zeros(len(self.interconnectors))])
+        bounds = np.vstack((
+            np.column_stack((np.zeros(n_levels), np.concatenate(
+                [curves.supply_mwh[s] for curves, s in zip(zone_curves, supply_free)]
+                + [curves.demand_mwh[s] for curves, s in zip(zone_curves, demand_free)]
+            ))),
+            self._flow_bounds,
+        ))
+
+        # Zone balance: supply - demand - exports + imports = 0
+        level_balance = sparse.csr_array(
+            (
+                np.concatenate((np.ones(supply_zone.size), -np.ones(demand_zone.size))),
+                (np.concatenate((supply_zone, demand_zone)), np.arange(n_levels)),
+            ),
+            shape=(self.n_zones, n_levels),
+        )
+        balance = sparse.hstack((level_balance, self._flow_balance), format="csr")
+
+        solution = linprog(cost, A_eq=balance, b_eq=-fixed_export, bounds=bounds, method="highs")
+        if solution.status != 0:
+            raise RuntimeError(f"Market coupling failed: {solution.message}")
+
+        # Step 3: Merge the solved levels back into the full curves
+        free_supply = np.split(solution.x[:n_supply.sum()], np.cumsum(n_supply)[:-1])
+        free_demand = np.split(solution.x[n_supply.sum():n_levels], np.cumsum(n_demand)[:-1])
+        for z in range(self.n_zones):
+            supply_cleared[z][supply_free[z]] = free_supply[z]
+            demand_cleared[z][demand_free[z]] = free_demand[z]
+
+        flows = solution.x[n_levels:]
+        return CouplingResult(
+            zone_prices=self._zone_prices(solution.eqlin.marginals, flows, zone_curves, supply_cleared, demand_cleared),
+            net_export=np.array([s.sum() - d.sum() for s, d in zip(supply_cleared, demand_cleared)]),
+            flows=flows,
+            supply_cleared=supply_cleared,
+            demand_cleared=demand_cleared,
+            welfare=fixed_welfare - float(solution.fun),
+            solver_time=time.perf_counter() - start,
+        )
+
+    def _zone_prices(self, duals, flows, zone_curves, supply_cleared, demand_cleared, tol: float = 1e-9):
+        """
+        Price of every zone: `Market.marginal_prices` of its price area, the dual of the
+        zone balance if the area clears no supply.
+        """
+        # Step 1: Join the zones of every interconnector with a flow strictly inside its ATC
+        area = list(range(self.n_zones))
+
+        def find(zone):
+            while area[zone] != zone:
+                area[zone] = area[area[zone]]
+                zone = area[zone]
+            return zone
+
+        for line, flow, (low, high) in zip(self.interconnectors, flows, self._flow_bounds):
+            if low + tol < flow < high - tol:
+                area[find(line.from_zone)] = find(line.to_zone)
+
+        # Step 2: Merit-order price of every area over the levels of its zones
+        zone_area = np.array([find(z) for z in range(self.n_zones)], dtype=np.intp)
+        prices = Market.marginal_prices(
+            self.n_zones,
+            np.repeat(zone_area, [curves.supply_price.size for curves in zone_curves]),
+            np.concatenate([curves.supply_mwh for curves in zone_curves]),
+            np.concatenate([curves.supply_price for curves in zone_curves]),
+            np.concatenate(supply_cleared),
+            np.repeat(zone_area, [curves.demand_price.size for curves in zone_curves]),
+            np.concatenate([curves.demand_mwh for curves in zone_curves]),
+            np.concatenate([curves.demand_price for curves in zone_curves]),
+            np.concatenate(demand_cleared),
+            tol,
+        )[zone_area]
+        return np.where(np.isnan(prices), duals[:self.n_zones], prices)
+
+
+def allocate_levels(mwh, price, level_price, level_cleared):
+    """
+    Distribute the cleared MWh of every price level over the bids at that level,
+    in merit order (submission order within a level).
+
+    Parameters:
+    - mwh, price: Arrays describing the bids of one side of a zone.
+    - level_price: Price levels of that side (as in `AggregatedCurves`).
+    - level_cleared: Cleared MWh per level.
+
+    Returns:
+    - allocation: Cleared MWh per bid.
+    """
+    mwh = np.asarray(mwh, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    order = np.argsort(price, kind="stable")
+    sorted_levels = np.sort(level_price)
+    level = np.searchsorted(sorted_levels, price[order])
+    cleared = np.asarray(level_cleared, dtype=np.float64)[np.argsort(level_price, kind="stable")]
+
+    # MWh of earlier bids at the same level
+    cum_before = np.cumsum(mwh[order]) - mwh[order]
+    level_start = cum_before[np.searchsorted(level, level, side="left")]
+
+    allocation = np.empty(mwh.size)
+    allocation[order] = np.clip(cleared[level] - (cum_before - level_start), 0.0, mwh[order])
+    return allocation
+
+
+def _aggregate_levels(mwh, price):
+    """
+    Unique ascending prices and the total MWh at each of them.
+    """
+    levels, inverse = np.unique(np.asarray(price, dtype=np.float64), return_inverse=True)
+    return levels, np.bincount(inverse.ravel(), weights=np.asarray(mwh, dtype=np.float64), minlength=levels.size)
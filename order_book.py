@@ -0,0 +1,393 @@
+import heapq
+from collections import defaultdict
+from itertools import compress
+from operator import attrgetter, is_not
+
+import numpy as np
+
+from bid_book import BUY, SELL
+from market_clearing import Market
+
+
+class OrderBookSide():
+    """
+    One side of the order book. Bids are keyed by bidder id and kept in merit order
+    across steps as NumPy columns, so only bids that changed have to be inserted, moved
+    or removed.
+
+    Changes are collected and applied to the columns in one pass when the book is read:
+    a change of quantity patches its row in place and keeps its position, a new or
+    repriced bid is inserted behind the bids already at its price (time priority) and
+    removed bids are deleted.
+
+    Attributes:
+    -----------
+    descending (bool):  True for the demand side (most expensive first)
+    version (int):      incremented by every change that reaches the columns
+    """
+
+    def __init__(self, descending: bool = False):
+        self.descending = descending
+        self.version = 0
+
+        # bid_id -> (mwh, price, sequence number) of the bids in the columns
+        self._bids = {}
+        # bid_id -> (mwh, price), or None for a removal, not yet applied to the columns
+        self._pending = {}
+        self._seq = 0
+
+        # Columns in merit order, sorted by (signed price, sequence number)
+        self._ids = np.empty(0, dtype=object)
+        self._mwh = np.empty(0)
+        self._price = np.empty(0)
+        self._key = np.empty(0)
+        self._seqs = np.empty(0, dtype=np.int64)
+
+        # Payloads of the last `sync_payloads`, None after a `sync` with tuples
+        self._payloads = None
+
+    def __len__(self):
+        self._flush()
+        return len(self._bids)
+
+    def __contains__(self, bid_id):
+        return self._current(bid_id) is not None
+
+    def upsert(self, bid_id, mwh, price):
+        """
+        Insert a new bid or update an existing one. Returns True if the book changed.
+        """
+        current = self._current(bid_id)
+        if current is not None and current[0] == mwh and current[1] == price:
+            return False
+        self._pending[bid_id] = (mwh, price)
+        return True
+
+    def remove(self, bid_id):
+        """
+        Remove a bid from the book.
+        """
+        if self._current(bid_id) is None:
+            raise KeyError(bid_id)
+        if bid_id in self._bids:
+            self._pending[bid_id] = None
+        else:
+            del self._pending[bid_id]
+
+    def sync(self, bids):
+        """
+        Make the book equal to the given bids, touching only the ones that changed.
+
+        Parameters:
+        - bids: Iterable of tuples (id, MWh, price), at most one bid per id.
+
+        Returns:
+        - n_changes: Number of bids inserted, updated or removed.
+        """
+        self._flush()
+        self._payloads = None
+
+        n_changes = 0
+        seen = set()
+        for bid_id, mwh, price in bids:
+            if bid_id in seen:
+                raise ValueError(f"Duplicate bid id in order book update: {bid_id}")
+            seen.add(bid_id)
+            n_changes += self.upsert(bid_id, mwh, price)
+
+        for bid_id in self._bids.keys() - seen:
+            self.remove(bid_id)
+            n_changes += 1
+
+        return n_changes
+
+    def sync_payloads(self, payloads, id_field: str):
+        """
+        Make the book equal to the given frozen bid payloads (with `mwh` and `price`).
+        When the bidders send in the same order as in the previous sync, only payloads
+        that are not the same object as before are read, so unchanged bids resent by
+        their agents cost no Python work. Otherwise the book is synced bid by bid.
+
+        Parameters:
+        - payloads: Sequence of payloads, at most one per bidder.
+        - id_field: Name of the payload field holding the bidder id.
+
+        Returns:
+        - n_changes: Number of bids inserted, updated or removed.
+        """
+        bidder_id = attrgetter(id_field)
+        payloads = list(payloads)
+        previous = self._payloads
+
+        if previous is not None and len(payloads) == len(previous):
+            changed = list(compress(range(len(payloads)), map(is_not, payloads, previous)))
+            if all(bidder_id(payloads[i]) == bidder_id(previous[i]) for i in changed):
+                self._payloads = payloads
+                return sum(self.upsert(bidder_id(payloads[i]), payloads[i].mwh, payloads[i].price) for i in changed)
+
+        n_changes = self.sync((bidder_id(p), p.mwh, p.price) for p in payloads)
+        self._payloads = payloads
+        return n_changes
+
+    def arrays(self):
+        """
+        Bids in merit order as arrays (ids, mwh, price). The columns are owned by the
+        book and patched by later changes.
+        """
+        self._flush()
+        return self._ids, self._mwh, self._price
+
+    def _current(self, bid_id):
+        # (mwh, price) of a bid including the pending changes, None if it is not in the book
+        if bid_id in self._pending:
+            return self._pending[bid_id]
+        bid = self._bids.get(bid_id)
+        return None if bid is None else bid[:2]
+
+    def _position(self, price, seq):
+        # Row of a bid in the columns
+        key = -price if self.descending else price
+        low = np.searchsorted(self._key, key, side="left")
+        high = np.searchsorted(self._key, key, side="right")
+        return low + np.searchsorted(self._seqs[low:high], seq)
+
+    def _flush(self):
+        """
+        Apply the pending changes to the columns.
+        """
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        self.version += 1
+
+        # Step 1: Patch quantity changes in place, collect rows to delete and bids to insert
+        delete = []
+        new_ids, new_mwh, new_price = [], [], []
+        for bid_id, bid in pending.items():
+            current = self._bids.get(bid_id)
+            if current is not None:
+                row = self._position(current[1], current[2])
+                if bid is not None and bid[1] == current[1]:
+                    self._mwh[row] = bid[0]
+                    self._bids[bid_id] = (bid[0], current[1], current[2])
+                    continue
+                delete.append(row)
+                del self._bids[bid_id]
+            if bid is not None:
+                self._bids[bid_id] = (bid[0], bid[1], self._seq)
+                self._seq += 1
+                new_ids.append(bid_id)
+                new_mwh.append(bid[0])
+                new_price.append(bid[1])
+
+        # Step 2: Delete the removed and repriced rows
+        columns = ("_ids", "_mwh", "_price", "_key", "_seqs")
+        if delete:
+            for name in columns:
+                setattr(self, name, np.delete(getattr(self, name), delete))
+
+        # Step 3: Insert the new rows behind the bids already at their price. Their sequence
+        # numbers are the largest in the book and increase in the order of `new_ids`.
+        if new_ids:
+            new_price = np.array(new_price, dtype=np.float64)
+            new_key = -new_price if self.descending else new_price
+            order = np.argsort(new_key, kind="stable")
+            new_seqs = np.arange(self._seq - len(new_ids), self._seq)
+            rows = np.searchsorted(self._key, new_key[order], side="right")
+            values = (
+                np.array(new_ids, dtype=object)[order], np.array(new_mwh, dtype=np.float64)[order],
+                new_price[order], new_key[order], new_seqs[order],
+            )
+            for name, value in zip(columns, values):
+                setattr(self, name, np.insert(getattr(self, name), rows, value))
+
+
+class OrderBook():
+    """
+    Persistent order book with a supply and a demand side that stay in merit order
+    between clearings, so a clearing never sorts the bids again.
+
+    Applying k changed bids costs O(k log n) Python work to locate them, plus one
+    vectorized copy of the columns per clearing (not per change). `upsert`/`remove` and
+    `sync_payloads` with bidders in the same order only read the changed bids, `sync`
+    reads all n of them. Clearing the kept merit order is a linear vectorized pass plus
+    one Python tuple per match, and a book without changes is not cleared again.
+    """
+
+    def __init__(self):
+        self.supply = OrderBookSide(descending=False)
+        self.demand = OrderBookSide(descending=True)
+
+        # (supply version, demand version, pricing) -> result of the last clearing
+        self._cleared = None
+
+    def sync(self, supply_bids, demand_bids):
+        """
+        Replace the content of the book with the bids of the current step.
+
+        Parameters:
+        - supply_bids: Iterable of tuples (id, MWh, price) representing supply bids.
+        - demand_bids: Iterable of tuples (id, MWh, price) representing demand bids.
+
+        Returns:
+        - n_changes: Number of bids inserted, updated or removed on both sides.
+        """
+        return self.supply.sync(supply_bids) + self.demand.sync(demand_bids)
+
+    def sync_payloads(self, supply_payloads, demand_payloads):
+        """
+        Replace the content of the book with the `SellBid` and `BuyBid` payloads of the
+        current step, reading only the payloads that were not sent in the previous step.
+
+        Returns:
+        - n_changes: Number of bids inserted, updated or removed on both sides.
+        """
+        return (
+            self.supply.sync_payloads(supply_payloads, "seller_id")
+            + self.demand.sync_payloads(demand_payloads, "buyer_id")
+        )
+
+    def market_clearing(self, pricing="uniform"):
+        """
+        Clear the book. The result is reused while the book does not change.
+
+        Parameters:
+        - pricing: Pricing rule of the matches, one of `PRICING_RULES`.
+
+        Returns:
+        - cleared_bids: List of tuples (supply_id, demand_id, matched MWh, price).
+        - clearing_price: The uniform market clearing price, None if the curves do not cross.
+        """
+        supply_ids, supply_mwh, supply_price = self.supply.arrays()
+        demand_ids, demand_mwh, demand_price = self.demand.arrays()
+
+        key = (self.supply.version, self.demand.version, pricing)
+        if self._cleared is None or self._cleared[0] != key:
+            self._cleared = (key, Market.market_clearing_vectorized(
+                supply_ids, supply_mwh, supply_price,
+                demand_ids, demand_mwh, demand_price,
+                presorted=True, pricing=pricing,
+            ))
+
+        cleared_bids, clearing_price = self._cleared[1]
+        return list(cleared_bids), clearing_price
+
+
+class LimitOrderBook():
+    """
+    Continuous limit order book with price-time priority, for intraday trading.
+
+    Every incoming order is matched immediately against the best resting orders of the
+    other side; trades happen at the price of the resting order and whatever is left of
+    the incoming order rests in the book. Both sides are binary heaps and cancelled orders
+    are removed lazily when they reach the top, so submitting and cancelling are O(log n).
+    """
+
+    def __init__(self):
+        # Heaps of (signed price, order id); order ids increase, so they give time priority
+        self._bids = []
+        self._asks = []
+        # order id -> [owner, side, remaining MWh, price]
+        self._orders = {}
+        self._by_owner = defaultdict(set)
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._orders)
+
+    def best_bid(self):
+        """
+        Highest resting buy price, None if there is none.
+        """
+        self._prune(self._bids)
+        return -self._bids[0][0] if self._bids else None
+
+    def best_ask(self):
+        """
+        Lowest resting sell price, None if there is none.
+        """
+        self._prune(self._asks)
+        return self._asks[0][0] if self._asks else None
+
+    def submit(self, owner, side, mwh, price):
+        """
+        Match an order against the book and rest the remainder.
+
+        Parameters:
+        - owner: Id of the agent submitting the order.
+        - side: `BUY` or `SELL`.
+        - mwh: Quantity of the order.
+        - price: Limit price of the order.
+
+        Returns:
+        - order_id: Id of the resting remainder, None if the order was filled completely.
+        - fills: List of tuples (seller_id, buyer_id, matched MWh, price).
+        """
+        if side == BUY:
+            opposite, own, crosses = self._asks, self._bids, lambda best: best <= price
+        elif side == SELL:
+            opposite, own, crosses = self._bids, self._asks, lambda best: -best >= price
+        else:
+            raise ValueError(f"Unknown order side: {side}")
+
+        fills = []
+        remaining = mwh
+        while remaining > 0:
+            self._prune(opposite)
+            if not opposite or not crosses(opposite[0][0]):
+                break
+
+            resting_id = opposite[0][1]
+            resting = self._orders[resting_id]
+            match_mwh = min(remaining, resting[2])
+            if side == BUY:
+                fills.append((resting[0], owner, match_mwh, resting[3]))
+            else:
+                fills.append((owner, resting[0], match_mwh, resting[3]))
+
+            remaining -= match_mwh
+            resting[2] -= match_mwh
+            if resting[2] == 0:
+                heapq.heappop(opposite)
+                self._remove(resting_id)
+
+        if remaining <= 0:
+            return None, fills
+
+        order_id = self._next_id
+        self._next_id += 1
+        self._orders[order_id] = [owner, side, remaining, price]
+        self._by_owner[owner].add(order_id)
+        heapq.heappush(own, (-price if side == BUY else price, order_id))
+
+        return order_id, fills
+
+    def cancel(self, order_id) -> bool:
+        """
+        Cancel a resting order. Returns False if it was already filled or cancelled.
+        """
+        if order_id not in self._orders:
+            return False
+        self._remove(order_id)
+        return True
+
+    def cancel_owner(self, owner) -> int:
+        """
+        Cancel all resting orders of an agent. Returns the number of cancelled orders.
+        """
+        order_ids = list(self._by_owner.get(owner, ()))
+        for order_id in order_ids:
+            self._remove(order_id)
+        return len(order_ids)
+
+    def _remove(self, order_id):
+        owner = self._orders.pop(order_id)[0]
+        owned = self._by_owner[owner]
+        owned.discard(order_id)
+        if not owned:
+            del self._by_owner[owner]
+
+    def _prune(self, heap):
+        # Drop cancelled orders from the top of a heap
+        while heap and heap[0][1] not in self._orders:
+            heapq.heappop(heap)
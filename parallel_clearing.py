@@ -0,0 +1,189 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Sequence
+
+import numpy as np
+
+from bid_book import BUY, SELL, BidBook
+from market_clearing import TIE_BREAKING, Market
+
+
+class ZoneClearingPool():
+    """
+    Clears independent bidding zones in parallel on a persistent process pool.
+
+    The bids of all zones are packed into one shared-memory block (MWh, price, agent and
+    side columns) and every worker writes the cleared MWh of its zone into a shared output
+    block, so no bid arrays are pickled. Zones smaller than `min_parallel_bids` are cleared
+    in process, where the dispatch overhead would outweigh the gain.
+
+    Attributes:
+    -----------
+    n_workers (int):            number of worker processes
+    min_parallel_bids (int):    minimum number of bids in a zone to send it to the pool
+    tie_breaking (str):         default allocation among bids at the same price, one of `TIE_BREAKING`
+    """
+
+    def __init__(self, n_workers: int = None, min_parallel_bids: int = 10_000, tie_breaking: str = "time"):
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.min_parallel_bids = min_parallel_bids
+
+        if tie_breaking not in TIE_BREAKING:
+            raise ValueError(f"Unknown tie breaking: {tie_breaking}")
+        self.tie_breaking = tie_breaking
+
+        self._executor = None
+        self._bids = None
+        self._allocation = None
+
+    def clear(self, zones: Sequence[BidBook], seed: int = 0, tie_breaking: str = None):
+        """
+        Clear every zone with uniform pricing.
+
+        Parameters:
+        - zones: One BidBook per zone.
+        - seed: Seed of the "random" tie breaking, zone z uses `seed + z`.
+        - tie_breaking: Tie breaking of this clear, one of `TIE_BREAKING`, the one of the pool if None.
+
+        Returns:
+        - clearing_prices: Array with the price of every zone, NaN where the curves do not cross.
+        - allocations: List with an array of cleared MWh per bid for every zone.
+        """
+        tie_breaking = self.tie_breaking if tie_breaking is None else tie_breaking
+        if tie_breaking not in TIE_BREAKING:
+            raise ValueError(f"Unknown tie breaking: {tie_breaking}")
+
+        sizes = np.fromiter((len(zone) for zone in zones), dtype=np.intp, count=len(zones))
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+        parallel = np.flatnonzero(sizes >= self.min_parallel_bids)
+        if self.n_workers < 2 or parallel.size < 2:
+            parallel = parallel[:0]
+
+        clearing_prices = np.full(len(zones), np.nan)
+        allocations = [None] * len(zones)
+
+        futures = {}
+        if parallel.size:
+            bids, allocation = self._shared_blocks(int(offsets[-1]))
+            mwh, price, agent, side = _bid_columns(bids.buf, int(offsets[-1]))
+            for z in parallel:
+                start, end = offsets[z], offsets[z + 1]
+                mwh[start:end] = zones[z].mwh
+                price[start:end] = zones[z].price
+                agent[start:end] = zones[z].agent
+                side[start:end] = zones[z].side
+            del mwh, price, agent, side
+
+            executor = self._pool()
+            for z in parallel:
+                futures[z] = executor.submit(
+                    _clear_shared_zone, bids.name, allocation.name, int(offsets[-1]),
+                    int(offsets[z]), int(offsets[z + 1]), tie_breaking, seed + int(z),
+                )
+
+        # Small zones are cleared here while the pool works on the large ones
+        for z in np.setdiff1d(np.arange(len(zones)), parallel):
+            clearing_prices[z], allocations[z] = clear_zone(
+                zones[z].mwh, zones[z].price, zones[z].side, tie_breaking, seed=seed + int(z), key=zones[z].agent
+            )
+
+        if futures:
+            cleared = np.ndarray(int(offsets[-1]), dtype=np.float64, buffer=self._allocation.buf)
+            for z, future in futures.items():
+                clearing_prices[z] = future.result()
+                allocations[z] = cleared[offsets[z]:offsets[z + 1]].copy()
+            del cleared
+
+        return clearing_prices, allocations
+
+    def close(self):
+        """
+        Shut down the workers and release the shared memory.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for block in (self._bids, self._allocation):
+            if block is not None:
+                block.close()
+                block.unlink()
+        self._bids = self._allocation = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.n_workers)
+        return self._executor
+
+    def _shared_blocks(self, n_bids: int):
+        # Shared blocks are kept between clears and only reallocated when they are too small
+        if self._bids is None or self._bids.size < _bid_block_size(n_bids):
+            if self._bids is not None:
+                self._bids.close()
+                self._bids.unlink()
+                self._allocation.close()
+                self._allocation.unlink()
+            capacity = max(n_bids, 1)
+            self._bids = shared_memory.SharedMemory(create=True, size=_bid_block_size(capacity))
+            self._allocation = shared_memory.SharedMemory(create=True, size=8 * capacity)
+        return self._bids, self._allocation
+
+
+def _bid_block_size(n_bids: int) -> int:
+    return n_bids * (8 + 8 + 4 + 1)
+
+
+def _bid_columns(buffer, n_bids: int):
+    """
+    MWh, price, agent and side columns laid out in a shared buffer.
+    """
+    mwh = np.ndarray(n_bids, dtype=np.float64, buffer=buffer, offset=0)
+    price = np.ndarray(n_bids, dtype=np.float64, buffer=buffer, offset=8 * n_bids)
+    agent = np.ndarray(n_bids, dtype=np.int32, buffer=buffer, offset=16 * n_bids)
+    side = np.ndarray(n_bids, dtype=np.int8, buffer=buffer, offset=20 * n_bids)
+    return mwh, price, agent, side
+
+
+def clear_zone(mwh, price, side, tie_breaking="time", seed=0, key=None):
+    """
+    Clearing price and cleared MWh per bid of a single zone, `seed` seeds the "random" tie
+    breaking and `key` (e.g. agent indices) makes it independent of the order of the bids.
+    """
+    supply = np.flatnonzero(side == SELL)
+    demand = np.flatnonzero(side == BUY)
+    supply_allocation, demand_allocation, clearing_price = Market.market_allocation(
+        mwh[supply], price[supply], mwh[demand], price[demand], tie_breaking=tie_breaking, seed=seed,
+        supply_key=None if key is None else key[supply], demand_key=None if key is None else key[demand],
+    )
+
+    allocation = np.zeros(mwh.size)
+    allocation[supply] = supply_allocation
+    allocation[demand] = demand_allocation
+    return (np.nan if clearing_price is None else clearing_price), allocation
+
+
+def _clear_shared_zone(
+    bids_name: str, allocation_name: str, n_bids: int, start: int, end: int, tie_breaking: str = "time",
+    seed: int = 0):
+    """
+    Worker entry point: clear the zone stored at [start, end) of the shared blocks.
+    """
+    bids = shared_memory.SharedMemory(name=bids_name)
+    allocation = shared_memory.SharedMemory(name=allocation_name)
+    try:
+        mwh, price, agent, side = _bid_columns(bids.buf, n_bids)
+        cleared = np.ndarray(n_bids, dtype=np.float64, buffer=allocation.buf)
+        clearing_price, cleared[start:end] = clear_zone(
+            mwh[start:end], price[start:end], side[start:end], tie_breaking, seed, key=agent[start:end]
+        )
+        del mwh, price, agent, side, cleared
+        return clearing_price
+    finally:
+        bids.close()
+        allocation.close()